@@ -1,20 +1,44 @@
 import os
+import sys
+import argparse
 import requests
-from bs4 import BeautifulSoup
 import re
 from io import BytesIO
-from zipfile import ZipFile
-from tqdm import tqdm
-from datetime import datetime
+from zipfile import ZipFile, ZIP_STORED, BadZipFile
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from urllib.parse import urljoin, quote_plus
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
 import time
 import random
-from PIL import Image, UnidentifiedImageError
+import threading
+import queue
+import atexit
+import contextlib
+import socket
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+import struct
+import sqlite3
+import asyncio
+import json
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+import shutil
+import tempfile
+import functools
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import hashlib
+import zlib
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+# selenium, webdriver_manager, PIL and bs4 are imported inside the functions that need
+# them, so update checks and status reports start without loading a browser stack
 
 # Base directory for manga storage
 base_dir = r"C:\Users\gokag.DESKTOP-Q55650I\OneDrive\Z Mangas"
@@ -24,6 +48,590 @@ headers = {
     "Referer": "",
 }
 
+# Download pipeline: series -> image URLs -> page fetch -> transcode/validate -> CBZ
+series_workers = 2  # Series pages parsed (and covers fetched) ahead of the chapters
+chapter_workers = 2  # Chapters whose image URLs are resolved ahead of the page fetchers
+page_workers = 8  # Pages fetched in parallel, across all queued chapters
+pipeline_queue_size = 32  # Items waiting between two stages before the earlier one blocks
+page_retries = 3  # Attempts per page; each retry resumes the bytes already received
+
+# Chapter selection and run budgets. Chapters are handed to the pipeline fairly across series:
+# new chapters of series already in the library first, then backfill of older or new series
+chapter_range = None  # Chapter numbers to download, e.g. "1-50" or "1-10,25,40-"; None takes every number
+chapter_latest = None  # Only the newest N chapters listed on each series page
+chapter_order = "newest"  # Within a series: "newest" or "oldest" first
+run_time_budget = None  # Seconds after which no further chapters are started; chapters in progress finish
+run_byte_budget = None  # Page bytes downloaded after which no further chapters are started
+
+# Multi-process mode: this process discovers the series and hands their chapters to worker processes
+worker_processes = 1  # 1 runs every series through a single pipeline in this process
+worker_chapters = 2  # Chapters a worker process holds at once, so its next one is queued while one packs
+worker_max_attempts = 2  # A chapter whose worker process died this many times is given up on
+# Settings a worker process copies from the process that started it
+worker_settings = ("base_dir", "output_profile", "mangadex_api_url", "page_store_enabled", "http_cache_enabled",
+                   "hedge_enabled", "passthrough_jpeg", "split_tall_pages", "browser_headless",
+                   "chapter_range", "chapter_latest", "chapter_order", "run_byte_budget", "metrics_enabled", "cache_dir")
+# Settings a transcode or verify pool process copies from the process that started it
+pool_settings = ("max_image_pixels", "jpeg_tail_bytes")
+
+# Adaptive per-host pacing: a token bucket for the request rate plus an AIMD concurrency limit
+max_connections_per_host = 6  # Starting concurrency per host; adapts between 1 and host_max_concurrency
+host_max_concurrency = 16
+host_rate_limit = 8.0  # Starting requests per second per host
+host_min_rate = 0.5
+host_max_rate = 50.0
+host_target_latency = 2.0  # Seconds to first byte; slower hosts stop getting more concurrency
+throttle_statuses = (429, 503)  # Responses that mean "slow down"
+retry_backoff_base = 1.0  # Seconds; retries wait a random time up to base * 2^(attempt-1)
+retry_backoff_cap = 60.0
+
+# Image handling
+passthrough_jpeg = True  # Store JPEG pages byte-for-byte instead of re-encoding them
+transcode_workers = max(1, (os.cpu_count() or 2) - 1)  # Processes converting PNG/WebP/GIF pages
+
+# Output profiles fit pages to the device reading the library. A series keeps the profile
+# it was first downloaded with, so its later chapters match the earlier ones
+output_profile = "original"  # Profile for series downloaded from now on
+output_profiles = {
+    "original": None,  # Pages as downloaded; only non-JPEG pages are converted
+    "eink-1448": {"max_edge": 1448, "quality": 80, "grayscale": True},
+    "tablet-2048": {"max_edge": 2048, "quality": 85, "grayscale": False},
+}
+
+# Oversized pages (long webtoon strips)
+page_spool_threshold = 8 * 1024 * 1024  # Bodies larger than this are streamed to a temp file instead of RAM
+jpeg_tail_bytes = 1024 * 1024  # End of a spooled or archived JPEG searched for its end-of-image marker
+max_image_pixels = 300_000_000  # Decode limit for long strips; PIL's own bomb guard stops at about 89M
+split_tall_pages = False  # Cut long strips into reader-sized slices (001-01.jpg, 001-02.jpg, ...); decodes every strip
+split_max_aspect = 3.0  # Pages taller than this many widths count as strips
+split_page_height = 2400  # Target slice height in pixels; cuts prefer blank rows between panels
+
+# Preflight: size a job from image headers and check the free space before downloading
+preflight_enabled = True
+preflight_space_policy = "refuse"  # When the job doesn't fit: "refuse" it, or "trim" it to the chapters that fit
+preflight_workers = 16  # Concurrent chapter page fetches and HEAD requests
+preflight_sample_chapters = 5  # Series with more pending chapters are extrapolated from this many
+preflight_chapter_bytes = 200 * 1024 * 1024  # Generous size per chapter; pages are only sized when this much doesn't fit
+preflight_reserve_bytes = 1024 ** 3  # Free space to leave on the drive
+
+# Library index (SQLite) stored at the root of base_dir
+library_db_name = "library.db"
+
+# Library verification
+verify_workers = os.cpu_count() or 2  # Processes checking archives in parallel
+
+# Update checks
+update_check_workers = 16  # Series pages fetched concurrently while looking for new chapters
+
+# MangaDex cover lookup
+mangadex_api_url = "https://api.mangadex.org"
+mangadex_covers_url = "https://uploads.mangadex.org/covers"
+cover_cache_name = "cover_cache.json"  # title -> manga id -> cover URL, kept in the local cache folder
+cover_cache_ttl = 30 * 24 * 3600  # Seconds before a cached lookup is refreshed
+cover_cache_max_entries = 5000  # Least recently used titles are evicted beyond this
+
+# Local caches live outside base_dir, which is often a cloud-synced folder: nothing in them
+# needs syncing, and a synced SQLite WAL is constant churn. One subfolder per library
+cache_dir = None  # None picks %LOCALAPPDATA%\MangaDownloader on Windows, ~/.cache/manga-downloader elsewhere
+
+# Content-addressed page store shared by every series in base_dir, kept in the local cache folder
+page_store_enabled = True
+page_store_dir_name = "page_store"
+page_store_max_bytes = 2 * 1024 ** 3  # Least recently used pages are evicted beyond this
+
+# HTTP cache for series and chapter HTML: compressed bodies plus validators in http_cache.db under cache_dir
+http_cache_enabled = True
+http_cache_name = "http_cache.db"
+http_cache_max_bytes = 256 * 1024 * 1024  # Compressed bodies; least recently used pages are dropped beyond this
+
+# Hedged page requests across the reader's mirror image servers
+hedge_enabled = True
+hedge_default_delay = 2.0  # Seconds to wait for a first byte before asking another mirror, until stats exist
+hedge_min_delay = 0.25
+hedge_max_delay = 10.0
+hedge_min_samples = 20  # Responses from a mirror before its own p95 sets the deadline
+
+# Selenium driver pool
+driver_pool_size = 2  # Warm browsers kept alive for the whole run
+driver_max_uses = 25  # Restart a browser after this many checkouts
+browser_headless = True  # Set to False to watch the browser while debugging
+browser_block_resources = True  # Pages only need their HTML and scripts; image bytes come over plain HTTP
+# DevTools resource types failed before they are sent, whatever their URL looks like
+browser_blocked_resource_types = ["Image", "Media", "Font", "Stylesheet"]
+
+# Run metrics, written to <base_dir>/metrics at the end of a run
+metrics_enabled = True
+metrics_dir_name = "metrics"
+
+class Metrics:
+    """Timing spans and counters for one run, exported as JSON and Prometheus text.
+
+    Follows metrics_enabled at every call, so the setting can change after import. When
+    disabled, spans and counters return immediately without taking the lock.
+    """
+
+    max_samples = 10000  # Durations kept per span for the percentiles
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+
+    @property
+    def enabled(self):
+        return metrics_enabled
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now()
+            self._spans = {}
+            self._counters = {}
+
+    def observe(self, name, seconds):
+        with self._lock:
+            span = self._spans.get(name)
+            if span is None:
+                span = self._spans[name] = {"count": 0, "total": 0.0, "max": 0.0, "samples": []}
+            span["count"] += 1
+            span["total"] += seconds
+            span["max"] = max(span["max"], seconds)
+            if len(span["samples"]) < self.max_samples:
+                span["samples"].append(seconds)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def _timed_block(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def span(self, name):
+        """Context manager timing the enclosed block under `name`."""
+        return self._timed_block(name) if self.enabled else _null_span
+
+    def timed(self, name):
+        """Decorator timing every call of the wrapped function under `name`."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        with self._lock:
+            spans = {}
+            for name, span in self._spans.items():
+                samples = sorted(span["samples"])
+                pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+                spans[name] = {"count": span["count"], "total_s": round(span["total"], 4),
+                               "mean_s": round(span["total"] / span["count"], 4), "max_s": round(span["max"], 4),
+                               "p50_s": round(pick(0.50), 4), "p95_s": round(pick(0.95), 4), "p99_s": round(pick(0.99), 4)}
+            return {"started_at": self.started_at.isoformat(timespec='seconds'),
+                    "finished_at": datetime.now().isoformat(timespec='seconds'),
+                    "spans": spans, "counters": dict(self._counters)}
+
+    def prometheus_text(self, summary=None):
+        summary = summary or self.summary()
+        lines = ["# HELP manga_stage_seconds Time spent in each download pipeline stage.",
+                 "# TYPE manga_stage_seconds summary"]
+        for name, span in sorted(summary["spans"].items()):
+            for quantile, key in (("0.5", "p50_s"), ("0.95", "p95_s"), ("0.99", "p99_s")):
+                lines.append(f'manga_stage_seconds{{stage="{name}",quantile="{quantile}"}} {span[key]}')
+            lines.append(f'manga_stage_seconds_sum{{stage="{name}"}} {span["total_s"]}')
+            lines.append(f'manga_stage_seconds_count{{stage="{name}"}} {span["count"]}')
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(f"# TYPE manga_{name}_total counter")
+            lines.append(f"manga_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory):
+        """Write run-<timestamp>.json and a scrapeable manga_downloader.prom; returns the JSON path."""
+        os.makedirs(directory, exist_ok=True)
+        summary = self.summary()
+        json_path = os.path.join(directory, f"run-{self.started_at.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(json_path, "w", encoding="utf-8") as json_file:
+            json.dump(summary, json_file, indent=2)
+        prom_path = os.path.join(directory, "manga_downloader.prom")
+        with open(prom_path + ".tmp", "w", encoding="utf-8") as prom_file:
+            prom_file.write(self.prometheus_text(summary))
+        os.replace(prom_path + ".tmp", prom_path)  # Scrapers never see a half-written file
+        return json_path
+
+_null_span = contextlib.nullcontext()
+metrics = Metrics()
+
+def export_metrics():
+    if metrics.enabled:
+        json_path = metrics.export(os.path.join(base_dir, metrics_dir_name))
+        print(f"Run metrics saved to {json_path}")
+
+_http_session = None
+_http_adapter = None
+_http_lock = threading.Lock()
+_host_limiters = {}
+
+def get_http_session():
+    """Return the process-wide requests session, creating it on first use."""
+    global _http_session, _http_adapter
+    with _http_lock:
+        if _http_session is None:
+            session = requests.Session()
+            session.headers.update(headers)  # Requests only add their own extras, so a browser hand-off can swap these
+            # Keep enough pooled keep-alive connections for every page worker
+            _http_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(page_workers, host_max_concurrency))
+            session.mount("https://", _http_adapter)
+            session.mount("http://", _http_adapter)
+            _http_session = session
+    return _http_session
+
+def isolated_http_session():
+    """Session with its own cookie jar that still reuses the shared connection pool and headers.
+
+    Let it go out of scope instead of closing it: closing a session closes its adapters,
+    which would drop every keep-alive connection in the shared pool.
+    """
+    shared_session = get_http_session()
+    session = requests.Session()
+    session.headers.update(shared_session.headers)
+    session.mount("https://", _http_adapter)
+    session.mount("http://", _http_adapter)
+    return session
+
+class HostLimiter:
+    """Request pacing for one host: a token bucket for the rate and an AIMD concurrency limit.
+
+    Fast successful responses grow both additively; throttling, timeouts and dropped
+    connections halve them, and a Retry-After pauses every request to the host.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.rate = host_rate_limit
+        self.limit = float(max_connections_per_host)
+        self.tokens = 1.0
+        self.in_flight = 0
+        self.latency = None  # Moving average of the time to first byte
+        self.paused_until = 0.0
+        self._refilled_at = time.monotonic()
+        self._decreased_at = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        # The bucket holds up to one slot's worth of burst, so a healthy host can start a batch at once
+        self.tokens = min(max(1.0, self.limit), self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.in_flight >= int(self.limit):
+                        wait = None  # Woken by release()
+                    elif self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        return
+                    else:
+                        wait = (1 - self.tokens) / self.rate
+                self._cond.wait(timeout=wait)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency):
+        with self._cond:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if self.latency <= host_target_latency:
+                self.limit = min(host_max_concurrency, self.limit + 1 / self.limit)
+                self.rate = min(host_max_rate, self.rate + 0.5)
+            self._cond.notify_all()
+
+    def on_congestion(self, retry_after=None):
+        with self._cond:
+            now = time.monotonic()
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            # Requests already in flight fail together; only back off once per round trip
+            if now - self._decreased_at > max(1.0, self.latency or 0):
+                self._decreased_at = now
+                self.limit = max(1.0, self.limit / 2)
+                self.rate = max(host_min_rate, self.rate / 2)
+                print(f"Slowing down for {self.host}: {int(self.limit)} connection(s), {self.rate:.1f} req/s")
+        metrics.count("throttled")
+
+def get_host_limiter(url):
+    host = urlparse(url).netloc
+    with _http_lock:
+        limiter = _host_limiters.get(host)
+        if limiter is None:
+            limiter = _host_limiters[host] = HostLimiter(host)
+    return limiter
+
+@contextmanager
+def host_slot(url):
+    """Hold one of the adaptive slots of the host of `url`; yields the host's limiter."""
+    limiter = get_host_limiter(url)
+    limiter.acquire()
+    try:
+        yield limiter
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError):
+        limiter.on_congestion()
+        raise
+    finally:
+        limiter.release()
+
+@contextmanager
+def limited_get(session, url, on_slot=None, **kwargs):
+    """GET `url` inside a host slot and feed the response time and status back to the limiter.
+
+    `on_slot` is called once the slot is held, just before the request is sent.
+    """
+    with limited_request(session, "GET", url, on_slot=on_slot, **kwargs) as response:
+        yield response
+
+@contextmanager
+def limited_request(session, method, url, on_slot=None, **kwargs):
+    with host_slot(url) as limiter:
+        start = time.monotonic()
+        if on_slot:
+            on_slot()
+        with session.request(method, url, **kwargs) as response:
+            if response.status_code in throttle_statuses:
+                limiter.on_congestion(retry_after_seconds(response))
+            elif response.status_code < 500:
+                limiter.on_success(time.monotonic() - start)
+            yield response
+
+def retry_after_seconds(response):
+    """Seconds asked for by a Retry-After header (delta or HTTP date), capped at retry_backoff_cap."""
+    value = response.headers.get('Retry-After', '').strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return min(float(value), retry_backoff_cap)
+    try:
+        delay = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+    return min(max(delay, 0.0), retry_backoff_cap)
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than what the server asked for."""
+    delay = random.uniform(0, min(retry_backoff_cap, retry_backoff_base * 2 ** (attempt - 1)))
+    return max(delay, retry_after or 0.0)
+
+HTTP_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used);
+"""
+
+# gzip and deflate always; br/zstd too when urllib3 has a decoder for them installed
+html_accept_encoding = make_headers(accept_encoding=True)["accept-encoding"]
+
+@dataclass
+class HtmlPage:
+    url: str
+    text: str
+    etag: str = None
+    last_modified: str = None
+    from_cache: bool = False  # The server answered 304 and the body came from disk
+
+class HttpCache:
+    """Series and chapter HTML kept zlib-compressed in SQLite with each page's ETag/Last-Modified.
+
+    Requests for a cached URL are made conditional, and a 304 is answered from
+    disk, so re-checking an unchanged series costs a few hundred bytes.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(HTTP_CACHE_SCHEMA)
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute("SELECT etag, last_modified, body FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, body = row
+        try:
+            text = zlib.decompress(body).decode("utf-8")
+        except (zlib.error, UnicodeDecodeError):
+            self.forget(url)
+            return None
+        return HtmlPage(url, text, etag, last_modified, from_cache=True)
+
+    def touch(self, url):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE pages SET last_used = ? WHERE url = ?", (time.time(), url))
+
+    def put(self, page):
+        body = zlib.compress(page.text.encode("utf-8"), 6)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT size FROM pages WHERE url = ?", (page.url,)).fetchone()
+            self.total_bytes += len(body) - (row[0] if row else 0)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, body, size, fetched_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (page.url, page.etag, page.last_modified, body, len(body),
+                 datetime.now().isoformat(timespec='seconds'), time.time()))
+            self._evict()
+
+    def forget(self, url):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT size FROM pages WHERE url = ?", (url,)).fetchone()
+            if row:
+                self.total_bytes -= row[0]
+                self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            row = self._conn.execute("SELECT url, size FROM pages ORDER BY last_used LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._conn.execute("DELETE FROM pages WHERE url = ?", (row[0],))
+            self.total_bytes -= row[1]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_http_cache = None
+
+def get_http_cache():
+    """The shared HTML cache, or None when it's disabled."""
+    global _http_cache
+    if not http_cache_enabled:
+        return None
+    with _http_lock:
+        if _http_cache is None:
+            os.makedirs(base_dir, exist_ok=True)
+            _http_cache = HttpCache(local_cache_path(http_cache_name, ("", "-wal", "-shm")), http_cache_max_bytes)
+            atexit.register(_http_cache.close)
+    return _http_cache
+
+def cached_html(url):
+    """The last copy of `url` that was downloaded, without going online, or None."""
+    http_cache = get_http_cache()
+    return http_cache.get(url) if http_cache and url else None
+
+def fetch_page(session, url, timeout=15, cache=True, referer=None):
+    """GET an HTML page as an HtmlPage, retrying throttled responses and dropped connections with backoff.
+
+    With `cache`, a cached copy makes the request conditional and a 304 is served from
+    disk. Pass cache=False when the page depends on the session's cookies.
+    """
+    http_cache = get_http_cache() if cache else None
+    cached = http_cache.get(url) if http_cache else None
+    request_headers = {'Accept-Encoding': html_accept_encoding}
+    if referer:
+        request_headers['Referer'] = referer
+    if cached and cached.etag:
+        request_headers['If-None-Match'] = cached.etag
+    if cached and cached.last_modified:
+        request_headers['If-Modified-Since'] = cached.last_modified
+
+    for attempt in range(1, page_retries + 1):
+        try:
+            with limited_get(session, url, headers=request_headers, timeout=timeout) as response:
+                if response.status_code not in throttle_statuses or attempt == page_retries:
+                    metrics.count("html_bytes_downloaded", response.raw.tell())  # As sent, before decompression
+                    if response.status_code == 304 and cached:
+                        metrics.count("http_cache_revalidated")
+                        http_cache.touch(url)
+                        return cached
+                    response.raise_for_status()
+                    page = HtmlPage(url, response.text, response.headers.get('ETag'),
+                                    response.headers.get('Last-Modified'))
+                    if http_cache:
+                        http_cache.put(page)
+                    return page
+                delay = backoff_delay(attempt, retry_after_seconds(response))
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == page_retries:
+                raise
+            delay = backoff_delay(attempt)
+        print(f"Retrying {url} in {delay:.1f}s...")
+        time.sleep(delay)
+
+def browser_get(driver, url):
+    """Load `url` in a browser, paced by the same per-host limiter as plain HTTP requests."""
+    with host_slot(url) as limiter:
+        start = time.monotonic()
+        driver.get(url)
+        limiter.on_success(time.monotonic() - start)
+        wait_for_page(driver)
+    hand_off_browser_session(driver)
+
+def wait_for_page(driver, timeout=15):
+    from selenium.webdriver.support.ui import WebDriverWait
+    WebDriverWait(driver, timeout).until(lambda d: d.execute_script("return document.readyState") == "complete")
+
+def series_folders():
+    """Folders in base_dir that hold a series, leaving out the downloader's own data folders."""
+    internal = {page_store_dir_name, metrics_dir_name}  # The page store is only here until it is moved out
+    return [folder for folder in os.listdir(base_dir)
+            if folder not in internal and os.path.isdir(os.path.join(base_dir, folder))]
+
+@contextmanager
+def file_lock(lock_path):
+    """Exclusive lock on `lock_path` that other processes respect; blocks until it is free."""
+    with open(lock_path, "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)  # Gives up after 10 seconds
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 def sanitize_filename(filename):
     return re.sub(r'[<>:"/\\|?*]', '', filename)
 
@@ -31,42 +639,140 @@ def clean_title_for_search(title):
     return re.sub(r"[^\w\s]", "", title).strip().replace(" ", "+")
 
 def log_error(manga_dir, error_message):
+    metrics.count("errors_logged")
     error_log_path = os.path.join(manga_dir, "error_log.txt")
     with open(error_log_path, "a", encoding="utf-8") as log_file:
         log_file.write(f"{datetime.now().isoformat()} - {error_message}\n")
     print(f"Error logged to {error_log_path}")
 
-def save_html_as_txt(manga_dir, html_content):
-    html_file_path = os.path.join(manga_dir, "page_content.txt")
-    with open(html_file_path, "w", encoding="utf-8") as html_file:
-        html_file.write(html_content)
-    return html_file_path
-
-def extract_alternative_titles_from_file(manga_dir):
-    page_content_path = os.path.join(manga_dir, "page_content.txt")
-    
-    if not os.path.exists(page_content_path):
-        print(f"page_content.txt not found in {manga_dir}")
-        return []
-
-    # Read the content of the page_content.txt file
-    with open(page_content_path, 'r', encoding='utf-8') as file:
-        html_content = file.read()
-
-    # Parse the HTML to extract alternative titles
-    soup = BeautifulSoup(html_content, 'html.parser')
-    alternative_titles_tag = soup.find('td', class_='table-label')
-    
-    if alternative_titles_tag and 'Alternative' in alternative_titles_tag.text:
-        alternative_titles_value = alternative_titles_tag.find_next_sibling('td', class_='table-value')
-        
-        if alternative_titles_value:
-            titles_text = alternative_titles_value.find('h2').text
-            alternative_titles = [title.strip() for title in titles_text.split(';')]
-            return alternative_titles
-
-    print("No alternative titles found in page_content.txt.")
-    return []
+# Parsed series page shared by download_manga, update_manga and the title/cover lookups
+@dataclass
+class SeriesPage:
+    title: str = ""
+    cover_url: str = ""
+    alternative_titles: list = field(default_factory=list)
+    chapters: list = field(default_factory=list)  # (chapter URL, chapter title), newest first
+
+# Parsed chapter reader page
+@dataclass
+class ChapterPage:
+    image_urls: list = field(default_factory=list)
+    server_links: list = field(default_factory=list)
+
+_html_parser = None
+
+def get_html_parser():
+    """Use lxml when it is installed; it parses several times faster than html.parser."""
+    global _html_parser
+    if _html_parser is None:
+        try:
+            import lxml.html  # noqa: F401
+            _html_parser = 'lxml'
+        except ImportError:
+            _html_parser = 'html.parser'
+    return _html_parser
+
+# Without lxml, only these parts of a page are built into the BeautifulSoup tree
+SERIES_PAGE_CLASSES = ["story-info-left", "story-info-right", "variations-tableInfo", "row-content-chapter"]
+CHAPTER_PAGE_CLASSES = ["container-chapter-reader", "server-image-btn"]
+
+def _has_class(name):
+    # XPath test equivalent to the CSS selector ".name"; the cheap substring test
+    # runs first so the exact token match is only evaluated on candidates
+    return f"contains(@class, '{name}') and contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+def _absolute_url(base_url, href):
+    return href if href.startswith(('http://', 'https://')) else urljoin(base_url, href)
+
+def _split_titles(titles_text):
+    return [title.strip() for title in titles_text.split(';') if title.strip()]
+
+def parse_series_page(html_content, url):
+    """Parse a series page once into its title, cover, alternative titles and chapter list."""
+    series_page = SeriesPage()
+    if not html_content.strip():
+        return series_page
+
+    if get_html_parser() == 'lxml':
+        from lxml import html as lxml_html
+        root = lxml_html.fromstring(html_content)
+        title_tags = root.xpath(f"//div[{_has_class('story-info-right')}]//h1")
+        cover_srcs = root.xpath(f"//div[{_has_class('story-info-left')}]//img[{_has_class('img-loading')}]/@src")
+        if title_tags:
+            series_page.title = title_tags[0].text_content().strip()
+        if cover_srcs:
+            series_page.cover_url = _absolute_url(url, cover_srcs[0])
+        for label in root.xpath(f"//td[{_has_class('table-label')}]"):
+            if 'Alternative' in label.text_content():
+                values = label.xpath(f"following-sibling::td[{_has_class('table-value')}][1]")
+                if values:
+                    series_page.alternative_titles = _split_titles(values[0].text_content())
+                break
+        # Per-row steps use plain substring tests and descendant:: rather than //,
+        # which on a 1000+ chapter list costs more than parsing the page
+        for link in root.xpath(f"//ul[{_has_class('row-content-chapter')}]/li[contains(@class, 'a-h')]/descendant::a[contains(@class, 'chapter-name')][@href]"):
+            series_page.chapters.append((_absolute_url(url, link.get('href')), link.text_content().strip()))  # Ensure the chapter URL is absolute
+        return series_page
+
+    from bs4 import BeautifulSoup, SoupStrainer
+    soup = BeautifulSoup(html_content, 'html.parser', parse_only=SoupStrainer(class_=SERIES_PAGE_CLASSES))
+    title_tag = soup.select_one('.story-info-right h1')
+    cover_img_tag = soup.select_one('.story-info-left img.img-loading')
+    if title_tag:
+        series_page.title = title_tag.get_text().strip()
+    if cover_img_tag and cover_img_tag.get('src'):
+        series_page.cover_url = urljoin(url, cover_img_tag['src'])
+    for label in soup.select('td.table-label'):
+        if 'Alternative' in label.get_text():
+            value = label.find_next_sibling('td', class_='table-value')
+            if value:
+                series_page.alternative_titles = _split_titles(value.get_text())
+            break
+    for link in soup.select('ul.row-content-chapter > li.a-h a.chapter-name[href]'):
+        series_page.chapters.append((_absolute_url(url, link['href']), link.get_text().strip()))  # Ensure the chapter URL is absolute
+    return series_page
+
+def parse_chapter_page(html_content, chapter_url):
+    """Parse a chapter reader page into its image URLs and image-server links."""
+    chapter_page = ChapterPage()
+    if not html_content.strip():
+        return chapter_page
+
+    if get_html_parser() == 'lxml':
+        from lxml import html as lxml_html
+        root = lxml_html.fromstring(html_content)
+        images = root.xpath(f"//div[{_has_class('container-chapter-reader')}]//img")
+        buttons = root.xpath(f"//*[{_has_class('server-image-btn')}]")
+    else:
+        from bs4 import BeautifulSoup, SoupStrainer
+        soup = BeautifulSoup(html_content, 'html.parser', parse_only=SoupStrainer(class_=CHAPTER_PAGE_CLASSES))
+        images = soup.select('.container-chapter-reader img')
+        buttons = soup.select('.server-image-btn')
+
+    for img in images:
+        img_src = img.get('src') or img.get('data-src')
+        if img_src:
+            chapter_page.image_urls.append(urljoin(chapter_url, img_src.strip()))
+    chapter_page.server_links = [btn.get('data-l') or btn.get('href') for btn in buttons]
+    return chapter_page
+
+def extract_alternative_titles_from_cache(manga_dir):
+    cached = cached_html(get_series_url(os.path.basename(manga_dir)))
+    if cached:
+        html_content = cached.text
+    else:
+        # Folders downloaded before the HTTP cache kept a copy of the series page here
+        page_content_path = os.path.join(manga_dir, "page_content.txt")
+        if not os.path.exists(page_content_path):
+            print(f"No cached series page for {manga_dir}")
+            return []
+        with open(page_content_path, 'r', encoding='utf-8') as file:
+            html_content = file.read()
+
+    alternative_titles = parse_series_page(html_content, "").alternative_titles
+    if not alternative_titles:
+        print("No alternative titles found in the cached series page.")
+    return alternative_titles
 
 def save_url(manga_dir, url):
     url_file_path = os.path.join(manga_dir, "url.txt")
@@ -74,9 +780,266 @@ def save_url(manga_dir, url):
         url_file.write(url)
     print(f"URL saved to {url_file_path}")
 
+LIBRARY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    folder TEXT NOT NULL UNIQUE,
+    url TEXT,
+    updated_at TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    profile TEXT
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    id INTEGER PRIMARY KEY,
+    series_id INTEGER NOT NULL REFERENCES series(id),
+    url TEXT,
+    title TEXT,
+    cbz_name TEXT NOT NULL,
+    pages INTEGER,
+    bytes INTEGER,
+    completed_at TEXT,
+    verified_mtime REAL,
+    verified_size INTEGER,
+    verified_full INTEGER,
+    profile TEXT,
+    UNIQUE (series_id, cbz_name)
+);
+CREATE INDEX IF NOT EXISTS chapters_url ON chapters(url);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_library_conn = None
+_library_lock = threading.RLock()
+
+def get_library_index():
+    """Open the library index once per process, importing existing folders on first use."""
+    global _library_conn
+    with _library_lock:
+        if _library_conn is None:
+            os.makedirs(base_dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(base_dir, library_db_name), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(LIBRARY_SCHEMA)
+            _migrate_library(conn)
+            _library_conn = conn
+            if get_library_meta("imported") is None:
+                import_existing_library()
+    return _library_conn
+
+def _migrate_library(conn):
+    # Add columns introduced after an index file was first created
+    series_columns = {row[1] for row in conn.execute("PRAGMA table_info(series)")}
+    chapter_columns = {row[1] for row in conn.execute("PRAGMA table_info(chapters)")}
+    with conn:
+        for column in ("etag", "last_modified", "profile"):
+            if column not in series_columns:
+                conn.execute(f"ALTER TABLE series ADD COLUMN {column} TEXT")
+        for column, column_type in (("verified_mtime", "REAL"), ("verified_size", "INTEGER"), ("verified_full", "INTEGER"),
+                                    ("profile", "TEXT")):
+            if column not in chapter_columns:
+                conn.execute(f"ALTER TABLE chapters ADD COLUMN {column} {column_type}")
+
+def get_library_meta(key):
+    with _library_lock:
+        row = _library_conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _set_library_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+def _series_id(conn, manga_title, url=None):
+    conn.execute("INSERT OR IGNORE INTO series (folder) VALUES (?)", (manga_title,))
+    if url:
+        conn.execute("UPDATE series SET url = ? WHERE folder = ?", (url, manga_title))
+    return conn.execute("SELECT id FROM series WHERE folder = ?", (manga_title,)).fetchone()[0]
+
+def register_series(manga_title, url):
+    conn = get_library_index()
+    with _library_lock, conn:
+        _series_id(conn, manga_title, url)
+
+def get_series_url(manga_title):
+    conn = get_library_index()
+    with _library_lock:
+        row = conn.execute("SELECT url FROM series WHERE folder = ?", (manga_title,)).fetchone()
+    return row[0] if row else None
+
+def get_series_validators(manga_title):
+    conn = get_library_index()
+    with _library_lock:
+        row = conn.execute("SELECT etag, last_modified FROM series WHERE folder = ?", (manga_title,)).fetchone()
+    return row if row else (None, None)
+
+def save_series_validators(manga_title, etag, last_modified):
+    conn = get_library_index()
+    with _library_lock, conn:
+        _series_id(conn, manga_title)
+        conn.execute("UPDATE series SET etag = ?, last_modified = ? WHERE folder = ?", (etag, last_modified, manga_title))
+
+def series_profile(manga_title):
+    """The output profile of a series: the one it was downloaded with, else output_profile for a new one."""
+    conn = get_library_index()
+    with _library_lock:
+        row = conn.execute(
+            "SELECT series.profile, COUNT(chapters.id) FROM series LEFT JOIN chapters ON chapters.series_id = series.id "
+            "WHERE series.folder = ? GROUP BY series.id", (manga_title,)).fetchone()
+    if row and row[0]:
+        profile_name = row[0]
+    elif row and row[1]:
+        profile_name = "original"  # Chapters downloaded before profiles existed
+    else:
+        profile_name = output_profile
+    if profile_name not in output_profiles:
+        print(f"Unknown output profile '{profile_name}' for {manga_title}; keeping pages as downloaded.")
+        return "original"
+    return profile_name
+
+def record_chapter(manga_title, chapter_url, chapter_title, cbz_path, page_count, completed_at=None, profile_name=None):
+    """Record a committed CBZ in the index; the whole update is one transaction."""
+    conn = get_library_index()
+    completed_at = completed_at or datetime.now().isoformat(timespec='seconds')
+    with _library_lock, conn:
+        series_id = _series_id(conn, manga_title)
+        conn.execute(
+            "INSERT OR REPLACE INTO chapters (series_id, url, title, cbz_name, pages, bytes, completed_at, profile) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (series_id, chapter_url, chapter_title, os.path.basename(cbz_path), page_count,
+             os.path.getsize(cbz_path), completed_at, profile_name))
+        conn.execute("UPDATE series SET updated_at = ?, profile = COALESCE(profile, ?) WHERE id = ?",
+                     (completed_at, profile_name, series_id))
+        _set_library_meta(conn, "summary_dirty", "1")
+
+def downloaded_chapters(manga_title):
+    """Return (chapter URLs, CBZ names) already in the library for one series."""
+    conn = get_library_index()
+    with _library_lock:
+        rows = conn.execute(
+            "SELECT chapters.url, chapters.cbz_name FROM chapters JOIN series ON series.id = chapters.series_id "
+            "WHERE series.folder = ?", (manga_title,)).fetchall()
+    return {url for url, _ in rows if url}, {cbz_name for _, cbz_name in rows}
+
+def parse_chapter_range(text):
+    """Parse "1-50", "1-10,25,40-" or "-5" into (low, high) pairs; None stands for an open end."""
+    ranges = []
+    for part in text.split(','):
+        low, dash, high = part.strip().partition('-')
+        low = float(low) if low.strip() else None
+        high = (float(high) if high.strip() else None) if dash else low
+        if low is None and high is None:
+            raise ValueError(f"empty chapter range in {text!r}")
+        if low is not None and high is not None and low > high:
+            raise ValueError(f"{part.strip()!r} runs from high to low")
+        ranges.append((low, high))
+    return ranges
+
+def chapter_number(chapter_url, chapter_title):
+    """The chapter number from a title like "Vol.2 Chapter 12.5: ..." or a URL ending in chapter-12.5; None if neither has one."""
+    match = (re.search(r'\bch(?:apter)?\.?\s*(\d+(?:\.\d+)?)', chapter_title, re.IGNORECASE)
+             or re.search(r'chapter[-_]?(\d+(?:\.\d+)?)', chapter_url, re.IGNORECASE))
+    return float(match.group(1)) if match else None
+
+def select_chapters(chapters):
+    """Apply chapter_latest and chapter_range to (chapter URL, chapter title) pairs listed newest first."""
+    if chapter_latest is not None:
+        chapters = chapters[:chapter_latest]
+    if chapter_range:
+        ranges = parse_chapter_range(chapter_range)
+
+        def in_range(number):
+            # Chapters without a number can't be placed in a range, so a range leaves them out
+            return number is not None and any((low is None or number >= low) and (high is None or number <= high)
+                                              for low, high in ranges)
+        chapters = [(chapter_url, chapter_title) for chapter_url, chapter_title in chapters
+                    if in_range(chapter_number(chapter_url, chapter_title))]
+    return chapters
+
+def pending_chapters(manga_title, series_page, selected=True):
+    """(chapter URL, chapter title) pairs of a series page that aren't in the library yet, newest first.
+
+    Only the chapters picked by chapter_latest and chapter_range count unless `selected` is False.
+    """
+    manga_dir = os.path.join(base_dir, manga_title)
+    known_chapters = downloaded_chapters(manga_title)
+    chapters = select_chapters(series_page.chapters) if selected else series_page.chapters
+    return [(chapter_url, chapter_title) for chapter_url, chapter_title in chapters
+            if not is_chapter_downloaded(known_chapters, chapter_url, get_cbz_path(manga_title, chapter_title, manga_dir))]
+
+def is_chapter_downloaded(known_chapters, chapter_url, cbz_path):
+    known_urls, known_cbz_names = known_chapters
+    # Chapters found by the importer have no URL yet, so match those by file name
+    return chapter_url in known_urls or os.path.basename(cbz_path) in known_cbz_names
+
+def import_existing_library():
+    """One-time import of series folders and CBZ files that predate the index."""
+    conn = _library_conn
+    print("Importing existing library into the index...")
+    imported = 0
+    with _library_lock, conn:
+        for manga_folder in series_folders():
+            manga_path = os.path.join(base_dir, manga_folder)
+            url = None
+            url_file_path = os.path.join(manga_path, "url.txt")
+            if os.path.exists(url_file_path):
+                with open(url_file_path, "r", encoding="utf-8") as url_file:
+                    url = url_file.read().strip() or None
+            series_id = _series_id(conn, manga_folder, url)
+
+            for file_name in os.listdir(manga_path):
+                if not file_name.lower().endswith(".cbz"):
+                    continue
+                cbz_path = os.path.join(manga_path, file_name)
+                try:
+                    with ZipFile(cbz_path) as cbz_file:
+                        page_count = len(cbz_file.namelist())  # Central directory only
+                        profile_name = cbz_profile(cbz_file)
+                except Exception as e:
+                    print(f"Skipping unreadable archive {cbz_path}: {e}")
+                    continue
+                stat = os.stat(cbz_path)
+                completed_at = datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds')
+                conn.execute(
+                    "INSERT OR IGNORE INTO chapters (series_id, title, cbz_name, pages, bytes, completed_at, profile) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (series_id, os.path.splitext(file_name)[0], file_name, page_count, stat.st_size, completed_at,
+                     profile_name))
+                conn.execute("UPDATE series SET profile = COALESCE(profile, ?) WHERE id = ?", (profile_name, series_id))
+                imported += 1
+
+            # Attach chapter URLs from an old download_log.txt, if one was ever written
+            log_file_path = os.path.join(manga_path, "download_log.txt")
+            if os.path.exists(log_file_path):
+                with open(log_file_path, "r", encoding="utf-8") as log_file:
+                    for line in log_file:
+                        fields = line.rstrip("\n").split("\t")
+                        if len(fields) == 3:
+                            chapter_url, chapter_title, _ = fields
+                            cbz_name = os.path.basename(get_cbz_path(manga_folder, chapter_title, manga_path))
+                            conn.execute("UPDATE chapters SET url = ?, title = ? WHERE series_id = ? AND cbz_name = ?",
+                                         (chapter_url, chapter_title, series_id, cbz_name))
+
+            conn.execute("UPDATE series SET updated_at = (SELECT MAX(completed_at) FROM chapters WHERE series_id = ?) "
+                         "WHERE id = ?", (series_id, series_id))
+        _set_library_meta(conn, "imported", datetime.now().isoformat(timespec='seconds'))
+        _set_library_meta(conn, "summary_dirty", "1")
+    print(f"Imported {imported} existing chapters.")
+
+@metrics.timed("selenium_start")
 def init_selenium():
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+
     chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")  # Simulate a maximized window
+    if browser_headless:
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--window-size=1920,1080")  # Same layout as a maximized desktop window
+    else:
+        chrome_options.add_argument("--start-maximized")  # Simulate a maximized window
     chrome_options.add_argument("--disable-blink-features=AutomationControlled")  # Bypass Selenium automation detection
     chrome_options.add_argument("--disable-extensions")  # Disable extensions
     chrome_options.add_argument("--disable-gpu")  # Disable GPU for better compatibility
@@ -85,68 +1048,350 @@ def init_selenium():
     chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
     
     # Start Chrome with the necessary options
-    chrome_service = Service(ChromeDriverManager().install())
+    chrome_service = Service(get_chromedriver_path())
     driver = webdriver.Chrome(service=chrome_service, options=chrome_options)
 
-    # Set a custom user-agent to mimic a real browser
-    driver.execute_cdp_cmd('Network.setUserAgentOverride', {
-        "userAgent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, Gecko) Chrome/104.0.5112.102 Safari/537.36"
-    })
+    # Use the same user-agent as the requests session, which also hides "HeadlessChrome"
+    driver.execute_cdp_cmd('Network.setUserAgentOverride', {"userAgent": headers['User-Agent']})
+
+    if browser_block_resources:
+        block_browser_resources(driver)
 
     return driver
 
+def block_browser_resources(driver):
+    """Fail the browser's requests for browser_blocked_resource_types before they are sent.
+
+    Fetch interception pauses every request of those types and a listener thread
+    answers each one with Fetch.failRequest. Only the bytes are refused, so <img src>
+    attributes stay readable. The listener ends when the browser quits.
+    """
+    import trio
+    from selenium.webdriver.common.bidi.cdp import BrowserError
+    ready = threading.Event()
+
+    async def fail_requests():
+        async with driver.bidi_connection() as connection:
+            session, devtools = connection.session, connection.devtools
+            patterns = [devtools.fetch.RequestPattern(resource_type=devtools.network.ResourceType(resource_type))
+                        for resource_type in browser_blocked_resource_types]
+            await session.execute(devtools.fetch.enable(patterns=patterns))
+            ready.set()
+            async for event in session.listen(devtools.fetch.RequestPaused):
+                try:
+                    await session.execute(devtools.fetch.fail_request(event.request_id,
+                                                                      devtools.network.ErrorReason.BLOCKED_BY_CLIENT))
+                except BrowserError:
+                    pass  # Navigation already cancelled this request (e.g. the pool's about:blank reset)
+
+    def listen():
+        try:
+            trio.run(fail_requests)
+        except Exception as e:  # Also how the listener ends once the browser is gone
+            if not ready.is_set():
+                print(f"Could not block resources in the browser, error: {e}")
+        finally:
+            ready.set()
+
+    threading.Thread(target=listen, name="browser-blocker", daemon=True).start()
+    ready.wait(15)  # Interception has to be on before the first page loads
+
+def hand_off_browser_session(driver):
+    """Copy the browser's cookies and user-agent into the shared requests session (not the headers config).
+
+    Anything the browser earned (consent or anti-bot cookies) then also applies to
+    the image downloads, which always go over plain HTTP.
+    """
+    session = get_http_session()
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''),
+                            path=cookie.get('path', '/'), secure=cookie.get('secure', False))
+    user_agent = driver.execute_script("return navigator.userAgent")
+    if user_agent:
+        session.headers['User-Agent'] = user_agent
+
+_chromedriver_path = None
+_chromedriver_lock = threading.Lock()
+
+def get_chromedriver_path():
+    """Resolve the chromedriver binary once per process."""
+    global _chromedriver_path
+    with _chromedriver_lock:
+        if _chromedriver_path is None:
+            from webdriver_manager.chrome import ChromeDriverManager
+            _chromedriver_path = ChromeDriverManager().install()
+    return _chromedriver_path
+
+class DriverPool:
+    """Keeps warm Chrome instances alive and lends them out one caller at a time."""
+
+    def __init__(self, size, max_uses):
+        self.size = size
+        self.max_uses = max_uses
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()  # Most recently used browser first, it is the warmest
+        self._uses = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def driver(self):
+        self._slots.acquire()
+        driver = None
+        try:
+            driver = self._checkout()
+            yield driver
+        finally:
+            if driver is not None:
+                self._checkin(driver)
+            self._slots.release()
+
+    def _checkout(self):
+        try:
+            driver = self._idle.get_nowait()
+        except queue.Empty:
+            driver = init_selenium()
+        with self._lock:
+            self._uses[driver] = self._uses.get(driver, 0) + 1
+        return driver
+
+    def _checkin(self, driver):
+        with self._lock:
+            uses = self._uses.get(driver, 0)
+        if uses >= self.max_uses:
+            self._discard(driver)
+            return
+        try:
+            # Reset state so the next caller starts from a clean browser
+            driver.delete_all_cookies()
+            driver.get("about:blank")
+        except Exception as e:
+            # The browser crashed or hung; replace it on the next checkout
+            print(f"Recycling broken browser: {e}")
+            self._discard(driver)
+            return
+        self._idle.put(driver)
+
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+
+driver_pool = DriverPool(driver_pool_size, driver_max_uses)
+atexit.register(driver_pool.close)
+
+@metrics.timed("human_like_wait")
 def human_like_interaction(driver):
-    time.sleep(random.uniform(2, 5))  # Random delay between 2-5 seconds
-    
-    # Simulate scrolling
+    # Pacing between page loads comes from the host limiter; here we only wait for
+    # the page to settle and scroll like a reader would
+    wait_for_page(driver)
     driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-    time.sleep(random.uniform(1, 3))
+    time.sleep(random.uniform(0.2, 0.6))
     driver.execute_script("window.scrollTo(0, 0);")
-    time.sleep(random.uniform(2, 5))
 
 def download_image(img_url, save_dir, save_name, max_retries=3):
     """Download image with retry mechanism."""
     save_path = os.path.join(save_dir, save_name)
     retries = 0
 
+    page_store = get_page_store()
+    stored = page_store.get_url(img_url) if page_store else None
+    if stored is not None:
+        with open(save_path, 'wb') as img_file:
+            img_file.write(stored)
+        print(f"Image restored from the page store: {save_path}")
+        return True
+
     while retries < max_retries:
+        retry_after = None
         try:
-            session = requests.Session()
-            # Set default headers, customize as needed
-            session.headers.update({
-                'User-Agent': 'Mozilla/5.0',
-            })
+            session = get_http_session()
             
-            with session.get(img_url, stream=True, timeout=10) as img_response:
+            with limited_get(session, img_url, stream=True, timeout=10) as img_response:
+                if img_response.status_code in throttle_statuses:
+                    retry_after = retry_after_seconds(img_response)
                 img_response.raise_for_status()
 
+                chunks = []
                 with open(save_path, 'wb') as img_file:
                     for chunk in img_response.iter_content(chunk_size=8192):
                         if chunk:
                             img_file.write(chunk)
-            
+                            chunks.append(chunk)
+
+            if page_store:
+                img_data = b''.join(chunks)
+                page_store.put(img_url, img_data, img_data)
             print(f"Image successfully downloaded and saved at: {save_path}")
             return True
         
         except requests.exceptions.RequestException as e:
             retries += 1
-            print(f"Attempt {retries} failed: {e}. Retrying...")
-            time.sleep(2)
+            delay = backoff_delay(retries, retry_after)
+            print(f"Attempt {retries} failed: {e}. Retrying in {delay:.1f}s...")
+            time.sleep(delay)
     
     print(f"Failed to download image after {max_retries} attempts.")
     return False
 
+class CoverCache:
+    """Persistent title -> (manga id, cover URL) map with a TTL and LRU eviction."""
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as cache_file:
+                    self._entries = OrderedDict(json.load(cache_file))
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable cover cache {path}: {e}")
+
+    @staticmethod
+    def key(title):
+        return re.sub(r"[^\w\s]", "", title).strip().lower()
+
+    def get(self, title):
+        key = self.key(title)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry["fetched_at"] > self.ttl:
+                return None
+            self._entries.move_to_end(key)  # Most recently used last
+            return entry
+
+    def put(self, title, manga_id, cover_url):
+        with self._lock:
+            self._entries[self.key(title)] = {"manga_id": manga_id, "cover_url": cover_url, "fetched_at": time.time()}
+            self._entries.move_to_end(self.key(title))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        # Other worker processes save the same file; merge their lookups instead of overwriting them
+        with self._lock, file_lock(self.path + ".lock"):
+            try:
+                with open(self.path, "r", encoding="utf-8") as cache_file:
+                    on_disk = json.load(cache_file)
+            except (OSError, ValueError):
+                on_disk = {}
+            for key, entry in on_disk.items():
+                if key not in self._entries or self._entries[key]["fetched_at"] < entry["fetched_at"]:
+                    self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as cache_file:
+                json.dump(self._entries, cache_file)
+            os.replace(temp_path, self.path)
+
+_cover_cache = None
+
+def get_cover_cache():
+    global _cover_cache
+    with _http_lock:
+        if _cover_cache is None:
+            _cover_cache = CoverCache(local_cache_path(cover_cache_name), cover_cache_ttl, cover_cache_max_entries)
+    return _cover_cache
+
+def search_mangadex_api(title):
+    """Return (manga id, original cover URL) of the best MangaDex match for `title`, or None."""
+    search_url = f"{mangadex_api_url}/manga"
+    params = {
+        "title": title,
+        "limit": 5,
+        "includes[]": "cover_art",
+        "order[relevance]": "desc",
+        "contentRating[]": ["safe", "suggestive", "erotica", "pornographic"],
+    }
+    with limited_get(get_http_session(), search_url, params=params, timeout=10) as response:
+        response.raise_for_status()
+    results = response.json().get("data", [])
+
+    # Prefer an exact title match, otherwise trust MangaDex's relevance order
+    wanted = CoverCache.key(title)
+    def is_exact(manga):
+        attributes = manga.get("attributes", {})
+        names = list(attributes.get("title", {}).values())
+        names += [name for alt in attributes.get("altTitles", []) for name in alt.values()]
+        return any(CoverCache.key(name) == wanted for name in names)
+    results.sort(key=lambda manga: not is_exact(manga))
+
+    for manga in results:
+        for relationship in manga.get("relationships", []):
+            file_name = relationship.get("attributes", {}).get("fileName")
+            if relationship.get("type") == "cover_art" and file_name:
+                return manga["id"], f"{mangadex_covers_url}/{manga['id']}/{file_name}"
+    return None
+
+def download_cover_via_api(manga_dir, candidate_titles):
+    """Resolve the cover of the first candidate title MangaDex knows and save the original file.
+
+    Returns True on success, False when no title matched, and None when the API couldn't be reached.
+    """
+    cover_cache = get_cover_cache()
+    resolved = {title: cover_cache.get(title) for title in candidate_titles}
+    missing = [title for title, entry in resolved.items() if entry is None]
+
+    # One batch of concurrent searches instead of one title after another
+    api_errors = 0
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), 8)) as executor:
+            futures = {title: executor.submit(search_mangadex_api, title) for title in missing}
+        for title, future in futures.items():
+            try:
+                match = future.result()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"MangaDex API search failed for {title}: {e}")
+                api_errors += 1
+                continue
+            manga_id, cover_url = match if match else (None, None)
+            cover_cache.put(title, manga_id, cover_url)  # Misses are cached too
+            resolved[title] = {"manga_id": manga_id, "cover_url": cover_url}
+        cover_cache.save()
+
+    for title in candidate_titles:
+        entry = resolved.get(title)
+        if entry and entry.get("cover_url"):
+            cover_url = entry["cover_url"]
+            extension = os.path.splitext(urlparse(cover_url).path)[1].lower() or ".jpg"
+            print(f"Found MangaDex cover for {title}: {cover_url}")
+            return download_image(cover_url, manga_dir, "cover" + (".jpg" if extension == ".jpeg" else extension))
+
+    if api_errors == len(missing) and missing:
+        return None
+    print(f"No MangaDex match for any of: {candidate_titles}")
+    return False
+
 def download_cover_from_mangadex(manga_title, manga_dir):
     """Attempt to download the cover image from MangaDex using Selenium."""
-    driver = init_selenium()
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
     try:
-        search_url = f"https://mangadex.org/search?q={manga_title.replace(' ', '+')}"
-        driver.get(search_url)
-        time.sleep(3)  # Allow time for page load
+        with driver_pool.driver() as driver:
+            search_url = f"https://mangadex.org/search?q={manga_title.replace(' ', '+')}"
+            browser_get(driver, search_url)
 
-        first_manga_card = driver.find_element(By.CSS_SELECTOR, 'div.grid.gap-2 img.rounded.shadow-md')
-        if first_manga_card:
-            cover_img_url = first_manga_card.get_attribute('src')
+            # Results are rendered client-side after the load event
+            first_manga_card = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, 'div.grid.gap-2 img.rounded.shadow-md')))
+            cover_img_url = first_manga_card.get_attribute('src') if first_manga_card else None
+
+        if cover_img_url:
             return download_image(cover_img_url, manga_dir, 'cover.jpg')
 
         print(f"No cover image found for {manga_title} on MangaDex.")
@@ -156,111 +1401,44 @@ def download_cover_from_mangadex(manga_title, manga_dir):
         print(f"Error downloading cover from MangaDex: {e}")
         return False
 
-    finally:
-        driver.quit()
-
-def search_using_alternative_titles(manga_title, manga_dir, alt_site_url):
-    """Search for alternative titles and attempt to download cover image using them."""
-    try:
-        response = requests.get(alt_site_url, headers={'User-Agent': 'Mozilla/5.0'})
-        response.raise_for_status()
-        html_content = response.text
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching alternative titles from {alt_site_url}: {e}")
-        return False
-
-    alternative_titles = extract_alternative_titles(html_content)
-
-    if alternative_titles:
-        print(f"Alternative titles found: {alternative_titles}")
-        for alt_title in alternative_titles:
-            if download_cover_from_mangadex(alt_title, manga_dir):
-                print(f"Cover image downloaded using alternative title: {alt_title}")
-                return True
-    print(f"Failed to download cover image using alternative titles.")
-    return False
-
-def extract_alternative_titles(html_content):
-    """Extract alternative manga titles from the HTML content."""
-    soup = BeautifulSoup(html_content, 'html.parser')
-    alternative_titles_tag = soup.find('td', class_='table-label', string='Alternative')
-
-    if alternative_titles_tag:
-        alternative_titles_value = alternative_titles_tag.find_next_sibling('td', class_='table-value')
-        if alternative_titles_value:
-            titles_text = alternative_titles_value.get_text(separator=';')
-            alternative_titles = [title.strip() for title in titles_text.split(';') if title.strip()]
-            return alternative_titles
-
-    return []
-
-def search_using_alternative_titles(manga_title, manga_dir, alt_site_url):
-    # Download and parse the alternative website HTML
-    try:
-        html_content = requests.get(alt_site_url, headers=headers).text
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to access {alt_site_url}: {e}")
-        return False
-
-    alternative_titles = extract_alternative_titles(html_content)
-
-    if alternative_titles:
-        print(f"Alternative titles found: {alternative_titles}")
-        for alt_title in alternative_titles:
-            if download_cover_from_mangadex(alt_title, manga_dir):
-                print(f"Cover image downloaded using alternative title: {alt_title}")
-                return True
-
-    print("Failed to download cover image using alternative titles.")
-    return False
-
 def search_mangadex_and_download_cover_selenium(manga_title, manga_dir, alt_site_url):
-    driver = None  # Initialize driver to None for better exception handling
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    cover_img_url = None
     try:
-        driver = init_selenium()  # Initialize Selenium driver
-        cleaned_title = clean_title_for_search(manga_title)
-        search_url = f"https://mangadex.org/search?q={cleaned_title}"
-        print(f"Searching for {manga_title} on MangaDex using Selenium: {search_url}")
-        
-        driver.get(search_url)
-        human_like_interaction(driver)  # Simulate human behavior on the page
-
-        # Try to find the first manga card that has an image
-        first_manga_card = driver.find_element(By.CSS_SELECTOR, 'div.grid.gap-2 img.rounded.shadow-md')
-        if not first_manga_card:
-            print(f"No results found on MangaDex for {manga_title}. Falling back to alternative titles...")
-            return search_using_alternative_titles_from_file(manga_title, manga_dir)
-
-        # Get the cover image URL
-        cover_img_url = first_manga_card.get_attribute('src')
-        print(f"Found cover image via Selenium: {cover_img_url}")
-
-        # Download and save the image using Selenium
-        driver.get(cover_img_url)
-        time.sleep(2)  # Wait for the image to fully load
-        save_path = os.path.join(manga_dir, "cover.jpg")
-
-        # Save the image as a screenshot
-        with open(save_path, "wb") as file:
-            file.write(driver.find_element(By.TAG_NAME, "img").screenshot_as_png)
+        with driver_pool.driver() as driver:
+            cleaned_title = clean_title_for_search(manga_title)
+            search_url = f"https://mangadex.org/search?q={cleaned_title}"
+            print(f"Searching for {manga_title} on MangaDex using Selenium: {search_url}")
+            
+            browser_get(driver, search_url)
+            human_like_interaction(driver)  # Simulate human behavior on the page
 
-        print(f"Image downloaded and saved at: {save_path}")
-        return True
+            # Try to find the first manga card that has an image
+            first_manga_card = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, 'div.grid.gap-2 img.rounded.shadow-md')))
+            cover_img_url = first_manga_card.get_attribute('src')
 
     except Exception as e:
         log_error(manga_dir, f"Error searching or downloading cover using Selenium: {e}")
-        # Fall back to alternative titles if there was an error
-        return search_using_alternative_titles_from_file(manga_title, manga_dir)
 
-    finally:
-        if driver:
-            driver.quit()  
+    # The browser goes back to the pool before the download or the fallback
+    if cover_img_url and cover_img_url.startswith("http"):
+        print(f"Found cover image via Selenium: {cover_img_url}")
+        # Original bytes over HTTP, with the browser's cookies, instead of a screenshot
+        if download_image(cover_img_url, manga_dir, "cover.jpg"):
+            return True
+    print(f"No results found on MangaDex for {manga_title}. Falling back to alternative titles...")
 
-def search_using_alternative_titles_from_file(manga_title, manga_dir):
-    alternative_titles = extract_alternative_titles_from_file(manga_dir)
+    # Fall back to alternative titles if nothing was found or there was an error
+    return search_using_cached_alternative_titles(manga_title, manga_dir)
+
+def search_using_cached_alternative_titles(manga_title, manga_dir):
+    alternative_titles = extract_alternative_titles_from_cache(manga_dir)
 
     if alternative_titles:
-        print(f"Alternative titles found in page_content.txt: {alternative_titles}")
+        print(f"Alternative titles found in the cached series page: {alternative_titles}")
         for alt_title in alternative_titles:
             if download_cover_from_mangadex(alt_title, manga_dir):
                 print(f"Cover image downloaded using alternative title: {alt_title}")
@@ -269,24 +1447,21 @@ def search_using_alternative_titles_from_file(manga_title, manga_dir):
     print("Failed to download cover image using alternative titles.")
     return False
 
-def extract_and_download_cover(manga_dir, html_file_path, base_url, manga_title, alt_site_url):
-    success = search_mangadex_and_download_cover_selenium(manga_title, manga_dir, alt_site_url)  # Use Selenium-based search
+def extract_and_download_cover(manga_dir, series_page, manga_title, alt_site_url):
+    candidate_titles = [manga_title] + series_page.alternative_titles
+    success = download_cover_via_api(manga_dir, list(dict.fromkeys(candidate_titles)))
+    if success is None:
+        # The API is unreachable; the browser-based search is slow but may still work
+        success = search_mangadex_and_download_cover_selenium(manga_title, manga_dir, alt_site_url)
     if success:
         return
 
     print("Falling back to original method to download cover image.")
-    with open(html_file_path, "r", encoding="utf-8") as file:
-        html_content = file.read()
-
-    soup = BeautifulSoup(html_content, 'html.parser')
-    cover_img_tag = soup.select_one('div.panel-story-info div.story-info-left img.img-loading')
-    
-    if not cover_img_tag or not cover_img_tag.get('src'):
+    if not series_page.cover_url:
         log_error(manga_dir, "Cover image tag not found or missing 'src' attribute.")
         return
 
-    cover_img_url = urljoin(base_url, cover_img_tag['src'])
-    download_image(cover_img_url, manga_dir, "cover.jpg")
+    download_image(series_page.cover_url, manga_dir, "cover.jpg")
 
 
 
@@ -296,267 +1471,2002 @@ def extract_and_download_cover(manga_dir, html_file_path, base_url, manga_title,
 
 # Switch image server via Selenium
 def switch_server(driver, server_number):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
     server_buttons = driver.find_elements(By.CLASS_NAME, 'server-image-btn')
     if server_buttons and len(server_buttons) >= server_number:
-        server_buttons[server_number - 1].click()
-        time.sleep(2)  # Wait for page to load
+        old_images = driver.find_elements(By.CSS_SELECTOR, 'div.container-chapter-reader img')
+        with host_slot(driver.current_url) as limiter:
+            start = time.monotonic()
+            server_buttons[server_number - 1].click()
+            try:
+                # The reader reloads with the new server; wait for the old images to go away
+                if old_images:
+                    WebDriverWait(driver, 15).until(EC.staleness_of(old_images[0]))
+                wait_for_page(driver)
+                limiter.on_success(time.monotonic() - start)
+            except TimeoutException:
+                limiter.on_congestion()
+                print(f"Server {server_number} did not finish loading in time")
     else:
         print(f"Failed to switch to server {server_number}")
 
-# Download and convert image to JPG
-def download_image_convert(img_url, save_dir, save_name):
-    save_path = os.path.join(save_dir, save_name)
+# Selenium-free image URL extraction for every image server
+def fetch_chapter_image_urls(chapter_url, referer=None):
+    """Yield one list of image URLs per reader server, primary server first.
+
+    Each alternate server costs a request or two, so it is only fetched when the
+    caller asks for the next list.
+    """
     try:
-        img_response = requests.get(img_url, headers=headers, stream=True, timeout=10)
-        img_response.raise_for_status()  # Ensure the request was successful
+        with metrics.span("chapter_page_fetch"):
+            response = fetch_page(get_http_session(), chapter_url, referer=referer)
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to fetch chapter page: {chapter_url}, error: {e}")
+        return
 
-        # Check if the response is an image by inspecting the Content-Type header
-        content_type = img_response.headers.get('Content-Type')
-        if 'image' not in content_type:
-            print(f"URL did not return an image: {img_url}, Content-Type: {content_type}")
-            return False
+    chapter_page = parse_chapter_page(response.text, chapter_url)
+    yield chapter_page.image_urls
 
-        # Try opening the image to check if it's valid
+    # Each server-image-btn points at a URL that stores the server choice in a
+    # cookie and sends us back to the reader, so follow it in a throwaway cookie jar
+    for server_link in chapter_page.server_links[1:]:
+        if not server_link or server_link.startswith(('#', 'javascript')):
+            yield []
+            continue
         try:
-            img = Image.open(BytesIO(img_response.content))
-        except UnidentifiedImageError as e:
-            print(f"Failed to identify image at URL: {img_url}, error: {e}")
-            return False
-
-        # Convert image to JPG if necessary
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-        img.save(save_path, "JPEG")
-        print(f"Image saved as {save_name}")
-        return True
+            session = isolated_http_session()
+            response = fetch_page(session, urljoin(chapter_url, server_link), cache=False, referer=chapter_url)
+            image_urls = parse_chapter_page(response.text, chapter_url).image_urls
+            if not image_urls:
+                # Not redirected back to the reader; reload it with the server cookie set
+                response = fetch_page(session, chapter_url, cache=False, referer=referer)
+                image_urls = parse_chapter_page(response.text, chapter_url).image_urls
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to switch image server via {server_link}, error: {e}")
+            image_urls = []
+        yield image_urls
+
+def iter_server_image_urls(chapter_url, referer=None):
+    """Yield the image URLs of each reader server, primary server first.
+
+    The static HTML is used when it has images, and alternate servers are fetched only
+    as far as the caller reads. A browser is only started when no server has images
+    in its static HTML; it then reads every server at once and goes back to the pool.
+    """
+    static_servers = fetch_chapter_image_urls(chapter_url, referer)
+    seen = []
+    for image_urls in static_servers:
+        seen.append(image_urls)
+        if image_urls:
+            yield from seen
+            yield from static_servers
+            return
+
+    print("No images in the static chapter HTML, falling back to Selenium...")
+    from selenium.webdriver.common.by import By
+    server_image_urls = []
+    with driver_pool.driver() as driver:
+        browser_get(driver, chapter_url)
+        for server_number in range(1, 3):  # Try both servers
+            if server_number > 1:
+                switch_server(driver, server_number)
+            # Find images using Selenium (ensure you're only selecting relevant images)
+            image_elements = driver.find_elements(By.CSS_SELECTOR, 'div.container-chapter-reader img')
+            server_image_urls.append([img_elem.get_attribute('src') for img_elem in image_elements])
+    yield from server_image_urls
+
+class ChapterServers:
+    """A chapter's image URL lists per reader server, read from iter_server_image_urls on demand.
+
+    The primary server is read up front; an alternate one only when a page needs it,
+    for a hedge or after a failure. Servers listing a different page count than the
+    primary can't stand in for it and are never offered.
+    """
+
+    def __init__(self, chapter_url, referer=None):
+        self._servers = iter_server_image_urls(chapter_url, referer)
+        self._lists = []
+        self._lock = threading.Lock()
+        self.primary_urls = None  # The first server with images
+        for server_index in itertools.count():
+            image_urls = self.get(server_index)
+            if image_urls is None or image_urls:
+                self.primary_urls = image_urls
+                break
+
+    def get(self, server_index):
+        """Image URLs of one server ([] when it has none); None once past the last server."""
+        with self._lock:
+            while len(self._lists) <= server_index and self._servers is not None:
+                image_urls = next(self._servers, None)
+                if image_urls is None:
+                    self._servers = None
+                else:
+                    self._lists.append(image_urls)
+            return self._lists[server_index] if server_index < len(self._lists) else None
+
+    def candidates(self, idx, exclude=()):
+        """(server index, URL) pairs for page `idx`; servers already read come first, fastest mirror first.
+
+        Servers in `exclude` are skipped, e.g. those that already sent a broken copy of the page.
+        """
+        with self._lock:
+            known = len(self._lists)
+        yield from mirror_stats.rank([(server_index, self._lists[server_index][idx - 1])
+                                      for server_index in range(known) if self._usable(server_index, exclude)])
+        for server_index in itertools.count(known):
+            if self.get(server_index) is None:
+                return
+            if self._usable(server_index, exclude):
+                yield server_index, self._lists[server_index][idx - 1]
+
+    def read_candidates(self, idx):
+        """The candidates of servers already read, without fetching any other."""
+        with self._lock:
+            known = len(self._lists)
+        return [(server_index, self._lists[server_index][idx - 1])
+                for server_index in range(known) if self._usable(server_index)]
+
+    def _usable(self, server_index, exclude=()):
+        return server_index not in exclude and len(self._lists[server_index]) == len(self.primary_urls or ())
+
+# Identify an image from its magic bytes and header, without decoding it
+def sniff_image(img_data):
+    """Return (format, width, height); format is None when the bytes aren't a known image."""
+    try:
+        if img_data[:3] == b'\xff\xd8\xff':
+            # Walk the JPEG segments until the start-of-frame marker that carries the size
+            pos = 2
+            while pos + 9 < len(img_data):
+                if img_data[pos] != 0xFF:
+                    break
+                marker = img_data[pos + 1]
+                if marker == 0xFF:
+                    pos += 1
+                    continue
+                segment_length = struct.unpack('>H', img_data[pos + 2:pos + 4])[0]
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack('>HH', img_data[pos + 5:pos + 9])
+                    return 'JPEG', width, height
+                pos += 2 + segment_length
+            return 'JPEG', 0, 0
+        if img_data[:8] == b'\x89PNG\r\n\x1a\n':
+            width, height = struct.unpack('>II', img_data[16:24])
+            return 'PNG', width, height
+        if img_data[:6] in (b'GIF87a', b'GIF89a'):
+            width, height = struct.unpack('<HH', img_data[6:10])
+            return 'GIF', width, height
+        if img_data[:4] == b'RIFF' and img_data[8:12] == b'WEBP':
+            chunk = img_data[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', img_data[26:30])
+                return 'WEBP', width & 0x3FFF, height & 0x3FFF
+            if chunk == b'VP8L':
+                bits = int.from_bytes(img_data[21:25], 'little')
+                return 'WEBP', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b'VP8X':
+                width = int.from_bytes(img_data[24:27], 'little') + 1
+                height = int.from_bytes(img_data[27:30], 'little') + 1
+                return 'WEBP', width, height
+            return 'WEBP', 0, 0
+    except (struct.error, IndexError):
+        pass
+    return None, 0, 0
+
+def sniff_image_file(image_file):
+    """sniff_image for a seekable file. JPEG segment headers are walked by seeking, so any
+    amount of metadata may come before the frame header without being read."""
+    image_format, width, height = sniff_image(image_file.read(65536))
+    if image_format != 'JPEG' or width:
+        return image_format, width, height
+    pos = 2
+    while True:
+        image_file.seek(pos)
+        header = image_file.read(9)
+        if len(header) < 9 or header[0] != 0xFF:
+            return 'JPEG', 0, 0
+        marker = header[1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', header[5:9])
+            return 'JPEG', width, height
+        pos += 2 + struct.unpack('>H', header[2:4])[0]
+
+def jpeg_tail_complete(tail):
+    """Whether a JPEG's last bytes have an end-of-image marker after their last start-of-scan.
+
+    A page cut off mid-stream has none. Padding or metadata may follow the marker, and
+    byte stuffing keeps it out of the scan data itself.
+    """
+    return tail.rfind(b'\xff\xd9') > tail.rfind(b'\xff\xda')
+
+# The functions below run inside the transcode process pool; `source` is the page's
+# bytes or, for a spooled page, the path of its temp file, and `profile` is an
+# entry of output_profiles (None keeps the page's own size)
+def open_page_image(source, profile=None):
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = max_image_pixels
+    try:
+        img = Image.open(BytesIO(source) if isinstance(source, bytes) else source)
+        if profile and img.format == "JPEG":
+            # libjpeg can decode straight to 1/2, 1/4 or 1/8 scale, far cheaper than a full decode
+            img.draft("L" if profile["grayscale"] else None, fitted_size(img.size, profile["max_edge"]))
+        img.load()  # Full decode, which also proves the file is intact
+    except Image.DecompressionBombError as e:
+        raise ValueError(str(e))
+    # Convert image to JPG if necessary
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    return img
+
+def fitted_size(size, max_edge):
+    width, height = size
+    scale = min(1.0, max_edge / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def encode_jpeg(img, profile=None, keep=None):
+    """`keep` holds the quantization tables and subsampling of the JPEG `img` was cut from; used without a profile."""
+    if profile:
+        from PIL import Image
+        if profile["grayscale"] and img.mode != "L":
+            img = img.convert("L")
+        size = fitted_size(img.size, profile["max_edge"])
+        if size != img.size:
+            img = img.resize(size, Image.LANCZOS)
+    jpeg_buffer = BytesIO()
+    if profile:
+        img.save(jpeg_buffer, "JPEG", quality=profile["quality"], optimize=True, progressive=True)
+    else:
+        img.save(jpeg_buffer, "JPEG", **(keep or {}))
+    return jpeg_buffer.getvalue()
+
+# Decode a page once and re-encode it as JPEG
+def transcode_to_jpeg(source, profile=None):
+    return encode_jpeg(open_page_image(source, profile), profile)
+
+# Cut a long strip into JPEG slices about slice_height tall, in reading order
+def split_strip(source, slice_height, profile=None):
+    img = open_page_image(source)  # Cut rows are found at full size; each slice is fitted afterwards
+    keep, step = None, 1
+    if not profile and getattr(img, "quantization", None):
+        # A JPEG strip cut on its block grid and re-encoded with its own tables comes out almost unchanged
+        from PIL import JpegImagePlugin
+        keep = {"qtables": img.quantization, "subsampling": JpegImagePlugin.get_sampling(img)}
+        step = 16 if keep["subsampling"] == 2 else 8  # 4:2:0 blocks are 16 rows tall
+    width, height = img.size
+    if profile:
+        # Slices no taller than the device screen keep their full width instead of being shrunk to fit
+        slice_height = min(slice_height, max(width, profile["max_edge"]))
+    count = max(1, round(height / slice_height))
+    cuts = [0] + [find_cut_row(img, round(height * n / count), slice_height // 5, step) for n in range(1, count)] + [height]
+    return [encode_jpeg(img.crop((0, top, width, bottom)), profile, keep) for top, bottom in zip(cuts, cuts[1:])]
+
+def find_cut_row(img, target, search, step=1):
+    """The flattest row within `search` rows of `target`, so cuts fall between panels rather than through them.
+
+    Only rows on a multiple of `step` are considered, such as JPEG block boundaries.
+    """
+    top = max(1, target - search)
+    band = img.crop((0, top, img.width, min(img.height - 1, target + search))).convert("L")
+    best_row, best_spread = max(step, target - target % step), 256
+    for y in range(-top % step, band.height, step):
+        low, high = band.crop((0, y, band.width, y + 1)).getextrema()
+        row = top + y
+        if high - low < best_spread or (high - low == best_spread and abs(row - target) < abs(best_row - target)):
+            best_row, best_spread = row, high - low
+    return best_row
+
+_transcode_pool = None
+
+def spawned_process_pool(max_workers):
+    """A process pool whose processes are spawned, not forked, with this process's pool_settings.
+
+    It is started from stage threads while other threads hold locks and SQLite
+    connections, and a forked child could inherit those mid-use and deadlock.
+    """
+    settings = {name: globals()[name] for name in pool_settings}
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=apply_settings, initargs=(settings,))
+
+def apply_settings(settings):
+    globals().update(settings)
+
+def get_transcode_pool():
+    global _transcode_pool
+    with _http_lock:
+        if _transcode_pool is None:
+            _transcode_pool = spawned_process_pool(transcode_workers)
+            atexit.register(_transcode_pool.shutdown)
+    return _transcode_pool
+
+def run_transcode(func, *args):
+    """Run one page job in the transcode pool.
+
+    A worker that crashes (out of memory, a decoder fault) breaks the whole pool, so
+    the broken pool is replaced and the page tried once more before giving up on it.
+    """
+    global _transcode_pool
+    for attempt in (1, 2):
+        pool = get_transcode_pool()
+        try:
+            return pool.submit(func, *args).result()
+        except BrokenProcessPool:
+            metrics.count("transcode_pool_restarts")
+            with _http_lock:
+                if _transcode_pool is pool:
+                    _transcode_pool = None
+            pool.shutdown(wait=False)
+            if attempt == 2:
+                raise
+
+class MirrorStats:
+    """Live time-to-first-byte and failure statistics per image host."""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._failures = {}
+
+    def record(self, url, seconds):
+        host = urlparse(url).netloc
+        if metrics.enabled:
+            metrics.observe("first_byte", seconds)  # One series for every host; the per-host view lives here
+        with self._lock:
+            self._samples.setdefault(host, deque(maxlen=self.window)).append(seconds)
+            self._failures[host] = self._failures.get(host, 0) * 0.9  # Old failures fade as requests succeed
+
+    def record_failure(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+
+    def _quantile(self, host, fraction):
+        samples = sorted(self._samples.get(host, ()))
+        if len(samples) < hedge_min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def hedge_delay(self, url):
+        """How long a request to this host may go without a first byte before it is hedged."""
+        with self._lock:
+            p95 = self._quantile(urlparse(url).netloc, 0.95)
+        if p95 is None:
+            return hedge_default_delay
+        return min(hedge_max_delay, max(hedge_min_delay, p95))
+
+    def rank(self, candidates):
+        """Order (server index, URL) candidates fastest first; unknown hosts keep the reader's order."""
+        def score(candidate):
+            host = urlparse(candidate[1]).netloc
+            with self._lock:
+                median = self._quantile(host, 0.5)
+                failures = self._failures.get(host, 0)
+            return (median if median is not None else hedge_default_delay / 2) * (1 + failures)
+        return sorted(candidates, key=score)
+
+mirror_stats = MirrorStats()
+
+_hedge_pool = None
+
+def get_hedge_pool():
+    global _hedge_pool
+    with _http_lock:
+        if _hedge_pool is None:
+            # Room for every page worker's request plus one hedge each
+            _hedge_pool = ThreadPoolExecutor(max_workers=page_workers * 2, thread_name_prefix="hedge")
+            atexit.register(_hedge_pool.shutdown, wait=False)
+    return _hedge_pool
+
+def fetch_hedged(candidates, save_name, manifest=None, referer=None):
+    """Fetch one page from whichever mirror answers first; returns (server index, URL, body) or None.
+
+    `candidates` are (server index, URL) pairs, preferred mirror first; they are only
+    taken from the iterable when needed, so a lazily read mirror costs nothing until
+    then. When the newest request hasn't produced a first byte within its host's p95
+    time to first byte, counted from when it got its host slot, the next mirror is asked as well; the first complete body wins
+    and the rest are cancelled.
+    """
+    remaining = iter(candidates)
+    first = next(remaining, None)
+    if first is None:
+        return None
+    if not hedge_enabled:
+        for server_index, img_url in itertools.chain([first], remaining):
+            img_data = fetch_image_bytes(img_url, save_name, manifest, referer=referer)
+            if img_data is not None:
+                return server_index, img_url, img_data
+        return None
+
+    cancel = threading.Event()
+    opened = OpenResponses()
+    pending = {}
+    more = True  # Whether `remaining` may still hold a mirror
+
+    def launch(candidate):
+        server_index, img_url = candidate
+        responded, requested = threading.Event(), threading.Event()
+        # Only the first request resumes from (and saves) the manifest's partial body
+        future = get_hedge_pool().submit(fetch_image_bytes, img_url, save_name, None if pending else manifest,
+                                         cancel=cancel, responded=responded, referer=referer, opened=opened,
+                                         requested=requested)
+        pending[future] = (server_index, img_url)
+        return img_url, responded, requested
+
+    newest = launch(first)
+    try:
+        while pending:
+            img_url, responded, requested = newest
+            # The delay runs from when the request got its host slot: a full local slot isn't a slow mirror
+            if more and requested.wait() and not responded.wait(mirror_stats.hedge_delay(img_url)):
+                candidate = next(remaining, None)
+                more = candidate is not None
+                if more:
+                    metrics.count("hedged_requests")
+                    newest = launch(candidate)
+                continue
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                server_index, img_url = pending.pop(future)
+                img_data = future.result()
+                if img_data is not None:
+                    if server_index != first[0]:
+                        metrics.count("hedge_wins")
+                    return server_index, img_url, img_data
+            if not pending and more:
+                # Every request so far failed outright; go straight to the next mirror
+                candidate = next(remaining, None)
+                more = candidate is not None
+                if more:
+                    newest = launch(candidate)
+        return None
+    finally:
+        # Losers that are mid-read have their connection cut; the rest stop at their next chunk
+        cancel.set()
+        opened.abort()
+        for future in pending:
+            future.add_done_callback(_discard_late_body)
+
+class HedgeLost(Exception):
+    """A hedged request that was cut off because another mirror delivered the page first."""
+
+class OpenResponses:
+    """The streaming responses of one hedged fetch that are still being read."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._responses = set()
+        self.aborted = False
+
+    def add(self, response):
+        with self._lock:
+            self._responses.add(response)
+            if self.aborted:
+                abort_response(response)
+
+    def discard(self, response):
+        # Called before the response is closed, so an abort never reaches a connection back in the pool
+        with self._lock:
+            self._responses.discard(response)
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            for response in self._responses:
+                abort_response(response)
+
+@contextmanager
+def track_response(opened, response):
+    """Keep `response` in `opened` (an OpenResponses, or None) while the body is read."""
+    if opened is None:
+        yield
+        return
+    opened.add(response)
+    try:
+        yield
+    except requests.exceptions.RequestException:
+        if opened.aborted:
+            raise HedgeLost() from None  # Not a connection problem, so the host limiter leaves it alone
+        raise
+    finally:
+        opened.discard(response)
 
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to download/convert image: {img_url}, error: {e}")
-        return False
+def abort_response(response):
+    """Cut off a response another thread is reading; shutting down the socket also ends a read blocked on it."""
+    sock = getattr(getattr(response.raw, "_connection", None), "sock", None)
+    if sock is not None:
+        try:
+            socket.socket.shutdown(sock, socket.SHUT_RDWR)  # The plain socket call, which leaves TLS state alone
+        except OSError:
+            pass
+
+def _discard_late_body(future):
+    if not future.cancelled() and future.exception() is None:
+        discard_body(future.result() or b'')
+
+PAGE_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    source_sha256 TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+"""
+
+class PageStore:
+    """Finished page and cover bytes on disk, addressed by SHA-256.
+
+    `urls` maps an image URL to the stored bytes and `sources` maps the hash of the
+    bytes as downloaded to the stored (possibly transcoded) bytes, so a known URL
+    is never fetched again and known content is never transcoded again. Pages made
+    for an output profile other than "original" are keyed under that profile.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, "index.db"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(PAGE_STORE_SCHEMA)
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        # This run's lookups, kept here as well so the summary doesn't depend on metrics_enabled
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def _key(key, profile):
+        return key if profile in (None, "original") else f"{key}|{profile}"
+
+    def _object_path(self, sha256):
+        return os.path.join(self.root, "objects", sha256[:2], sha256)
+
+    def _read(self, sha256):
+        try:
+            with open(self._object_path(sha256), "rb") as blob_file:
+                data = blob_file.read()
+        except OSError:
+            data = None
+        with self._lock, self._conn:
+            if data is None or self.digest(data) != sha256:
+                # Deleted or damaged behind our back; forget it so it's fetched again
+                self._forget(sha256)
+                return None
+            self._conn.execute("UPDATE blobs SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+        return data
+
+    def get_url(self, url, profile=None):
+        with self._lock:
+            row = self._conn.execute("SELECT sha256 FROM urls WHERE url = ?", (self._key(url, profile),)).fetchone()
+        data = self._read(row[0]) if row else None
+        with self._lock:
+            if data is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.count("page_store_url_hits" if data is not None else "page_store_url_misses")
+        return data
+
+    def get_source(self, url, source_data, profile=None):
+        """Stored bytes for content we've already processed; links `url` to them on a hit."""
+        url, source_sha256 = self._key(url, profile), self._key(self.digest(source_data), profile)
+        with self._lock:
+            row = self._conn.execute("SELECT sha256 FROM sources WHERE source_sha256 = ?", (source_sha256,)).fetchone()
+        data = self._read(row[0]) if row else None
+        if data is not None:
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO urls (url, sha256) VALUES (?, ?)", (url, row[0]))
+                self.hits += 1
+            metrics.count("page_store_content_hits")
+        return data
+
+    def put(self, url, source_data, data, profile=None):
+        sha256 = self.digest(data)
+        path = self._object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as blob_file:
+                blob_file.write(data)
+            os.replace(temp_path, path)
+        with self._lock, self._conn:
+            known = self._conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO blobs (sha256, size, last_used) VALUES (?, ?, ?)",
+                               (sha256, len(data), time.time()))
+            self._conn.execute("INSERT OR REPLACE INTO urls (url, sha256) VALUES (?, ?)",
+                               (self._key(url, profile), sha256))
+            self._conn.execute("INSERT OR REPLACE INTO sources (source_sha256, sha256) VALUES (?, ?)",
+                               (self._key(self.digest(source_data), profile), sha256))
+            if not known:
+                self.total_bytes += len(data)
+            self._evict()
+
+    def _forget(self, sha256):
+        row = self._conn.execute("SELECT size FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row:
+            self.total_bytes -= row[0]
+        self._conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+        self._conn.execute("DELETE FROM urls WHERE sha256 = ?", (sha256,))
+        self._conn.execute("DELETE FROM sources WHERE sha256 = ?", (sha256,))
+        try:
+            os.remove(self._object_path(sha256))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            row = self._conn.execute("SELECT sha256 FROM blobs ORDER BY last_used LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._forget(row[0])
+            metrics.count("page_store_evictions")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def library_cache_dir():
+    """This library's folder under cache_dir; keyed by base_dir so libraries never share or evict each other's data."""
+    root = cache_dir
+    if root is None:
+        if os.environ.get("LOCALAPPDATA"):
+            root = os.path.join(os.environ["LOCALAPPDATA"], "MangaDownloader")
+        else:
+            root = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "manga-downloader")
+    library_key = hashlib.sha1(os.path.abspath(base_dir).encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(root, library_key)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def local_cache_path(name, suffixes=("",)):
+    """Path of a cache under library_cache_dir(), moving it there if an older version left it in base_dir."""
+    path = os.path.join(library_cache_dir(), name)
+    legacy_path = os.path.join(base_dir, name)
+    if os.path.exists(legacy_path) and not os.path.exists(path):
+        print(f"Moving {name} out of the library folder to {path}...")
+        try:
+            for suffix in suffixes:  # SQLite keeps -wal and -shm files next to the database
+                if os.path.exists(legacy_path + suffix):
+                    shutil.move(legacy_path + suffix, path + suffix)
+        except OSError as e:
+            print(f"Could not move {legacy_path}: {e}; starting with an empty cache.")
+    return path
+
+_page_store = None
+
+def get_page_store():
+    """The shared page store, or None when it's disabled."""
+    global _page_store
+    if not page_store_enabled:
+        return None
+    with _http_lock:
+        if _page_store is None:
+            _page_store = PageStore(local_cache_path(page_store_dir_name), page_store_max_bytes)
+            atexit.register(_page_store.close)
+    return _page_store
+
+def report_page_store():
+    page_store = _page_store
+    if page_store is None:
+        return
+    print(f"Page store: {page_store.hits} hit(s), {page_store.misses} miss(es), "
+          f"{page_store.total_bytes / (1024 * 1024):.1f} MB stored")
+
+class SpooledPage:
+    """A page body kept in a temporary file because it is too large to hold in memory."""
+
+    def __init__(self, data=b''):
+        fd, self.path = tempfile.mkstemp(prefix="page-", suffix=".spool")
+        self._file = os.fdopen(fd, "wb")
+        self.size = 0
+        self.append(data)
+
+    def __len__(self):
+        return self.size
+
+    def append(self, data):
+        self._file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def sniff(self):
+        self._file.flush()
+        with open(self.path, "rb") as spool_file:
+            return sniff_image_file(spool_file)
+
+    def tail(self, count):
+        self._file.flush()
+        with open(self.path, "rb") as spool_file:
+            spool_file.seek(max(0, self.size - count))
+            return spool_file.read()
+
+    def copy_to(self, path):
+        self._file.flush()
+        shutil.copyfile(self.path, path)
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def append_body(received, chunks):
+    """Add downloaded chunks to a page body, moving it to a spool file once it outgrows page_spool_threshold."""
+    data = b''.join(chunks)
+    if isinstance(received, SpooledPage):
+        received.append(data)
+        return received
+    if len(received) + len(data) > page_spool_threshold:
+        spooled = SpooledPage(received)
+        spooled.append(data)
+        metrics.count("pages_spooled")
+        return spooled
+    return received + data
+
+def discard_body(received):
+    if isinstance(received, SpooledPage):
+        received.discard()
+    return b''
+
+# Download an image body, resuming a partially received one with an HTTP Range request
+@metrics.timed("page_fetch")
+def fetch_image_bytes(img_url, save_name, manifest=None, cancel=None, responded=None, referer=None, opened=None,
+                      requested=None):
+    """Return the image body (bytes or a SpooledPage), or None.
+
+    `cancel` stops the download at the next chunk; `responded` is set once the first
+    byte arrives or the attempt is over, whichever comes first, and `requested` once
+    the request holds its host slot or the attempt is over. `referer` is the series
+    page the image belongs to. `opened` is an OpenResponses that holds the response
+    while it is read, so a hedging caller can cut it off mid-read.
+    """
+    try:
+        return _fetch_image_bytes(img_url, save_name, manifest, cancel, responded, referer, opened, requested)
+    finally:
+        if requested:
+            requested.set()
+        if responded:
+            responded.set()
+
+def _fetch_image_bytes(img_url, save_name, manifest, cancel, responded, referer, opened, requested):
+    received, validator = manifest.load_partial(save_name, img_url) if manifest else (b'', None)
+    requested_at = None
+
+    def on_slot():
+        # Time to first byte starts here, so waiting behind our own host limiter doesn't count
+        nonlocal requested_at
+        requested_at = time.monotonic()
+        if requested:
+            requested.set()
+
+    delay = 0
+    for attempt in range(1, page_retries + 1):
+        if delay:
+            if cancel and cancel.wait(delay):
+                return discard_body(received) or None
+            delay = 0
+        if cancel and cancel.is_set():
+            return discard_body(received) or None
+        request_headers = {}
+        if referer:
+            request_headers['Referer'] = referer
+        if received:
+            request_headers['Range'] = f"bytes={len(received)}-"
+            if validator:
+                request_headers['If-Range'] = validator  # Only resume if the file hasn't changed
+        chunks = []
+        first_byte_at = None
+        try:
+            request = limited_get(get_http_session(), img_url, on_slot=on_slot, headers=request_headers, stream=True,
+                                  timeout=10)
+            with request as img_response, track_response(opened, img_response):
+                if img_response.status_code == 416:
+                    received = discard_body(received)  # Our partial body no longer matches; start over
+                    continue
+                if img_response.status_code in throttle_statuses:
+                    delay = backoff_delay(attempt, retry_after_seconds(img_response))
+                    metrics.count("page_retries")
+                    mirror_stats.record_failure(img_url)
+                    print(f"Attempt {attempt} for {save_name} throttled ({img_response.status_code}). Retrying in {delay:.1f}s...")
+                    continue
+                img_response.raise_for_status()  # Ensure the request was successful
+
+                # Check if the response is an image by inspecting the Content-Type header
+                content_type = img_response.headers.get('Content-Type', '')
+                if 'image' not in content_type:
+                    print(f"URL did not return an image: {img_url}, Content-Type: {content_type}")
+                    discard_body(received)
+                    return None
+
+                if img_response.status_code != 206:
+                    received = discard_body(received)  # The server ignored the range and sent the whole file
+                elif received:
+                    metrics.count("range_resumes")
+                validator = img_response.headers.get('ETag') or img_response.headers.get('Last-Modified')
+                expected_size = get_full_size(img_response, len(received))
+
+                for chunk in img_response.iter_content(chunk_size=16384):
+                    if first_byte_at is None:
+                        first_byte_at = time.monotonic()
+                        mirror_stats.record(img_url, first_byte_at - requested_at)
+                        if responded:
+                            responded.set()
+                    if cancel and cancel.is_set():
+                        return discard_body(received) or None  # Another mirror already delivered this page
+                    chunks.append(chunk)
+                    if len(chunks) == 64:  # Hand over every megabyte so a spooled body never sits in RAM
+                        received = append_body(received, chunks)
+                        metrics.count("bytes_downloaded", sum(map(len, chunks)))
+                        chunks = []
+                received = append_body(received, chunks)
+                metrics.count("bytes_downloaded", sum(map(len, chunks)))
+                chunks = []
+
+            if expected_size and len(received) < expected_size:
+                raise requests.exceptions.ChunkedEncodingError(f"received {len(received)} of {expected_size} bytes")
+
+            if manifest:
+                manifest.clear_partial(save_name)
+            return received
+
+        except HedgeLost:
+            return discard_body(received) or None
+
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            received = append_body(received, chunks)
+            metrics.count("bytes_downloaded", sum(map(len, chunks)))
+            metrics.count("page_retries")
+            mirror_stats.record_failure(img_url)
+            if manifest and received:
+                manifest.save_partial(save_name, img_url, validator, received)
+            delay = backoff_delay(attempt)
+            print(f"Attempt {attempt} for {save_name} failed after {len(received)} bytes: {e}. Retrying in {delay:.1f}s...")
 
-# Validate image content
-def validate_image(img_path):
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to download image: {img_url}, error: {e}")
+            discard_body(received)
+            return None
+
+    print(f"Failed to download {save_name} after {page_retries} attempts.")
+    discard_body(received)
+    return None
+
+def get_full_size(img_response, offset):
+    # "Content-Range: bytes 1000-4999/5000" carries the full size of a resumed body
+    content_range = img_response.headers.get('Content-Range', '')
+    if img_response.status_code == 206 and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    content_length = img_response.headers.get('Content-Length')
+    if content_length and content_length.isdigit() and 'Content-Encoding' not in img_response.headers:
+        return offset + int(content_length)
+    return None
+
+# Download an image and return it as JPEG bytes, converting only when it isn't JPEG already
+# (not timed as a whole: page_fetch and transcode already cover its two halves)
+def download_image_convert(img_url, save_name, manifest=None, profile_name="original", referer=None):
+    stored = stored_page(img_url, profile_name)
+    if stored is not None:
+        return stored
+
+    img_data = fetch_image_bytes(img_url, save_name, manifest, referer=referer)
+    if img_data is None:
+        return None
+    return prepare_page(img_url, save_name, img_data, profile_name)
+
+def stored_page(img_url, profile_name="original"):
+    """Finished bytes for an image URL seen before, or None."""
+    page_store = get_page_store()
+    return page_store.get_url(img_url, profile_name) if page_store else None
+
+def prepare_page(img_url, save_name, img_data, profile_name="original"):
+    """Turn a downloaded body into what goes into the CBZ, or None if it isn't a usable image.
+
+    That is JPEG bytes, a SpooledPage holding an oversized JPEG as-is, or a list of
+    JPEG slices when a long strip is split. Any profile but "original" re-encodes
+    every page, JPEG or not.
+    """
+    profile = output_profiles[profile_name]
+    spooled = isinstance(img_data, SpooledPage)
+    page_store = None if spooled else get_page_store()  # Only pages small enough to keep in RAM are stored
+    if page_store:
+        stored = page_store.get_source(img_url, img_data, profile_name)
+        if stored is not None:
+            return stored
+
+    image_format, width, height = img_data.sniff() if spooled else sniff_image(img_data)
+    is_strip = split_tall_pages and width and height > max(width * split_max_aspect, split_page_height * 1.5)
+    if passthrough_jpeg and image_format == 'JPEG' and not is_strip and profile is None:
+        metrics.count("pages_passthrough")
+        if not validate_image(img_data, save_name):
+            discard_body(img_data)
+            return None
+        if page_store:
+            page_store.put(img_url, img_data, img_data, profile_name)
+        return img_data
+
+    # Everything else is decoded exactly once, off the network threads; spooled pages
+    # are read from disk by the worker instead of being copied into it
+    source = img_data.path if spooled else img_data
+    if spooled:
+        img_data.close()
     try:
-        img = Image.open(img_path)
-        img.verify()  # Verify if image is valid
-        return True
-    except Exception as e:
-        print(f"Image validation failed: {img_path}, error: {e}")
-        os.remove(img_path)  # Remove corrupt image
+        with metrics.span("transcode"):
+            if is_strip:
+                page_data = run_transcode(split_strip, source, split_page_height, profile)
+            else:
+                page_data = run_transcode(transcode_to_jpeg, source, profile)
+    except (OSError, ValueError) as e:  # PIL's UnidentifiedImageError is an OSError
+        print(f"Failed to identify image at URL: {img_url}, error: {e}")
+        metrics.count("pages_failed")
+        return None
+    except Exception as e:  # A crashed worker, a decompression bomb, ...; only this page is lost
+        print(f"Failed to transcode image at URL: {img_url}, error: {e!r}")
+        metrics.count("pages_failed")
+        return None
+    finally:
+        if spooled:
+            img_data.discard()
+
+    if is_strip:
+        metrics.count("pages_split")
+        print(f"Split {save_name} ({width}x{height}) into {len(page_data)} slices")
+        return page_data
+    metrics.count("pages_transcoded")
+    if profile is None:
+        print(f"Image converted from {image_format or 'unknown format'}: {save_name}")
+    if page_store:
+        page_store.put(img_url, img_data, page_data, profile_name)
+    return page_data
+
+# Validate a pass-through JPEG from its structure, without decoding it
+@metrics.timed("image_validate")
+def validate_image(img_data, save_name):
+    spooled = isinstance(img_data, SpooledPage)
+    image_format, width, height = img_data.sniff() if spooled else sniff_image(img_data)
+    if image_format != 'JPEG' or not width or not height:
+        print(f"Image validation failed: {save_name}, error: unreadable JPEG header")
         return False
+    if not jpeg_tail_complete(img_data.tail(jpeg_tail_bytes) if spooled else img_data):
+        print(f"Image validation failed: {save_name}, error: truncated JPEG")
+        return False
+    return True
 
-# Download chapter images and handle retries for server switching
+# Download one chapter, trying the other image servers for pages the first one can't serve
 def download_chapter_images(chapter_url, manga_title, chapter_title, manga_dir):
-    # Initialize Selenium driver
-    driver = init_selenium()
-    driver.get(chapter_url)
-    
-    for server_number in range(1, 3):  # Try both servers
-        print(f"Trying server {server_number}...")
-        if server_number > 1:
-            switch_server(driver, server_number)
-        
-        # Find images using Selenium (ensure you're only selecting relevant images)
-        image_elements = driver.find_elements(By.CSS_SELECTOR, 'div.container-chapter-reader img')
-        if not image_elements:
-            print(f"No images found on server {server_number}.")
-            continue  # Retry with next server if no images found
-
-        chapter_images = []
-        for idx, img_elem in enumerate(image_elements, start=1):
-            img_url = img_elem.get_attribute('src')
-            save_name = f"{idx:03}.jpg"
-            save_path = os.path.join(manga_dir, save_name)
-
-            # Download and convert image to JPG
-            if download_image_convert(img_url, manga_dir, save_name):
-                if validate_image(save_path):
-                    chapter_images.append(save_path)
-
-        if chapter_images:
-            create_cbz_file(manga_title, chapter_title, manga_dir, chapter_images)
-            break
+    chapter = ChapterJob(manga_title, manga_dir, chapter_url, chapter_title)
+    get_chapter_pipeline().submit(chapter)
+    chapter.done.wait()
+    return chapter.completed
 
-    driver.quit()
-
-# Create CBZ file
-def create_cbz_file(manga_title, chapter_title, manga_dir, chapter_images):
+def get_cbz_path(manga_title, chapter_title, manga_dir):
     # Fix file name format without extra hyphen
     cbz_name = f"{manga_title} - {chapter_title.replace('-', '').strip()}.cbz"
-    cbz_path = os.path.join(manga_dir, cbz_name)
+    return os.path.join(manga_dir, cbz_name)
+
+class ChapterManifest:
+    """Checkpoint of an unfinished chapter: page count, finished pages and partial page bodies.
+
+    Lives in a "<cbz name>.resume" folder next to the archive until the CBZ is committed.
+    """
+
+    def __init__(self, cbz_path, chapter_url):
+        self.resume_dir = cbz_path + ".resume"
+        self.path = os.path.join(self.resume_dir, "manifest.json")
+        self.chapter_url = chapter_url
+        self._lock = threading.Lock()
+        self.reset(remove_files=False)
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as manifest_file:
+                    data = json.load(manifest_file)
+                if data.get("chapter_url") == chapter_url:
+                    self.page_total = data.get("page_total")
+                    self.profile_name = data.get("profile", "original")
+                    self.finished = set(data.get("finished", []))
+                    self.partial = data.get("partial", {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable resume manifest {self.path}: {e}")
+
+    def reset(self, remove_files=True):
+        if remove_files:
+            self.discard()
+        self.page_total = None
+        self.profile_name = None
+        self.finished = set()
+        self.partial = {}
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.resume_dir, exist_ok=True)
+            data = {"chapter_url": self.chapter_url, "page_total": self.page_total, "profile": self.profile_name,
+                    "finished": sorted(self.finished), "partial": self.partial}
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as manifest_file:
+                json.dump(data, manifest_file, indent=1)
+            os.replace(temp_path, self.path)
+
+    def mark_finished(self, save_name):
+        with self._lock:
+            self.finished.add(save_name)
+        self.save()
+
+    def _partial_path(self, save_name):
+        return os.path.join(self.resume_dir, save_name + ".partial")
+
+    def load_partial(self, save_name, img_url):
+        with self._lock:
+            info = self.partial.get(save_name)
+        partial_path = self._partial_path(save_name)
+        # Image URLs can change between runs; a body from another URL is useless
+        if not info or info.get("url") != img_url or not os.path.exists(partial_path):
+            return b'', None
+        received = b''
+        with open(partial_path, "rb") as partial_file:
+            while True:
+                block = partial_file.read(1024 * 1024)
+                if not block:
+                    break
+                received = append_body(received, [block])
+        return received, info.get("validator")
+
+    def save_partial(self, save_name, img_url, validator, received):
+        os.makedirs(self.resume_dir, exist_ok=True)
+        if isinstance(received, SpooledPage):
+            received.copy_to(self._partial_path(save_name))
+        else:
+            with open(self._partial_path(save_name), "wb") as partial_file:
+                partial_file.write(received)
+        with self._lock:
+            self.partial[save_name] = {"url": img_url, "validator": validator, "received": len(received)}
+        self.save()
+
+    def clear_partial(self, save_name):
+        with self._lock:
+            had_partial = self.partial.pop(save_name, None) is not None
+        if had_partial:
+            if os.path.exists(self._partial_path(save_name)):
+                os.remove(self._partial_path(save_name))
+            self.save()
+
+    def discard(self):
+        shutil.rmtree(self.resume_dir, ignore_errors=True)
+
+class CbzWriter:
+    """Streams pages into a temporary archive that replaces the CBZ only on commit.
+
+    With `resume`, pages go after those a previous run left in the ".part" archive.
+    With `keep_partial`, an unfinished archive is closed rather than deleted, so the
+    next run can resume it. The output profile goes in the zip comment.
+    """
+
+    def __init__(self, cbz_path, resume=False, profile_name=None, keep_partial=False):
+        self.cbz_path = cbz_path
+        self.temp_path = cbz_path + ".part"
+        self.profile_name = profile_name
+        self.keep_partial = keep_partial
+        self.page_names = []
+        self._committed = False
+        mode = 'w'
+        if resume and os.path.exists(self.temp_path):
+            try:
+                try:
+                    with ZipFile(self.temp_path) as part_file:
+                        self.page_names = part_file.namelist()
+                except BadZipFile:
+                    # The last run died before it could write the zip directory
+                    self.page_names = salvage_partial_archive(self.temp_path)
+                    print(f"Recovered {len(self.page_names)} pages from unfinished archive {self.temp_path}")
+                mode = 'a'
+            except (BadZipFile, OSError) as e:
+                print(f"Discarding damaged partial archive {self.temp_path}: {e}")
+        # JPEG data doesn't shrink under deflate, so store pages as-is
+        self._zip = ZipFile(self.temp_path, mode, compression=ZIP_STORED)
+
+    @property
+    def page_count(self):
+        return len(self.page_names)
+
+    @property
+    def source_page_count(self):
+        """Pages of the source chapter in the archive, counting a split strip once."""
+        return len({os.path.splitext(name)[0].split('-')[0] for name in self.page_names})
+
+    def has_page(self, name):
+        # A page that was split is stored as NNN-01.jpg, NNN-02.jpg, ...
+        slice_prefix = os.path.splitext(name)[0] + "-"
+        return name in self.page_names or any(page.startswith(slice_prefix) for page in self.page_names)
+
+    def add_page(self, name, page_data):
+        """Add one source page: bytes, a SpooledPage, or a list of slices stored as NNN-01.jpg, NNN-02.jpg, ..."""
+        if isinstance(page_data, list):
+            stem, extension = os.path.splitext(name)
+            width = max(2, len(str(len(page_data))))
+            for n, slice_data in enumerate(page_data, start=1):
+                self._write(f"{stem}-{n:0{width}}{extension}", slice_data)
+        else:
+            self._write(name, page_data)
+
+    def _write(self, name, page_data):
+        if isinstance(page_data, SpooledPage):
+            page_data.close()
+            self._zip.write(page_data.path, name)  # Streamed from disk
+            page_data.discard()
+        else:
+            self._zip.writestr(name, page_data)
+        self.page_names.append(name)
+
+    @metrics.timed("cbz_commit")
+    def commit(self):
+        if self.profile_name:
+            self._zip.comment = f"profile={self.profile_name}".encode()
+        self._zip.close()
+        if self.page_names != sorted(self.page_names):
+            self._rewrite_in_page_order()
+        os.replace(self.temp_path, self.cbz_path)  # Atomic on the same volume
+        self._committed = True
+
+    def _rewrite_in_page_order(self):
+        # Resumed pages were appended after later ones; keep the archive in reading order
+        ordered_path = self.temp_path + ".ordered"
+        with ZipFile(self.temp_path) as part_file, ZipFile(ordered_path, 'w', compression=ZIP_STORED) as ordered_file:
+            ordered_file.comment = part_file.comment
+            for name in sorted(self.page_names):
+                with part_file.open(name) as page_file, ordered_file.open(name, 'w') as ordered_page:
+                    shutil.copyfileobj(page_file, ordered_page, 1024 * 1024)
+        os.replace(ordered_path, self.temp_path)
+        self.page_names.sort()
+
+    def abort(self):
+        self._zip.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def close(self):
+        """Release the archive; with keep_partial an unfinished archive stays on disk for the next run."""
+        if self._committed:
+            return
+        if self.keep_partial:
+            self._zip.close()
+        else:
+            self.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def salvage_partial_archive(temp_path):
+    """Rebuild a ".part" archive that has no zip directory; returns the names of the pages kept.
+
+    Pages are stored uncompressed one after another, each behind a local header with
+    its name, size and CRC, so every page written in full can be copied to a new archive.
+    """
+    salvaged_path = temp_path + ".salvaged"
+    page_names = []
+    with open(temp_path, "rb") as part_file, ZipFile(salvaged_path, 'w', compression=ZIP_STORED) as salvaged_file:
+        while True:
+            header = part_file.read(30)
+            if len(header) < 30 or header[:4] != b'PK\x03\x04':
+                break
+            flags, method, crc, compressed_size, size, name_length, extra_length = struct.unpack('<6xHH4xLLLHH', header)
+            name = part_file.read(name_length).decode('utf-8' if flags & 0x800 else 'cp437')
+            part_file.seek(extra_length, 1)
+            # A header that was never patched after its page (the process died mid-page) has no size
+            if method != ZIP_STORED or not size or compressed_size != size:
+                break
+            page_data = part_file.read(size)
+            if len(page_data) < size or zlib.crc32(page_data) != crc:
+                break
+            salvaged_file.writestr(name, page_data)
+            page_names.append(name)
+    os.replace(salvaged_path, temp_path)
+    return page_names
+
+def cbz_profile(cbz_file):
+    """The output profile recorded in an open CBZ, or None for archives written before profiles."""
+    match = re.match(rb"profile=([\w.-]+)", cbz_file.comment)
+    return match.group(1).decode() if match else None
+
+# Create CBZ file from (name, image bytes) pairs
+@metrics.timed("cbz_create")
+def create_cbz_file(manga_title, chapter_title, manga_dir, chapter_images):
+    cbz_path = get_cbz_path(manga_title, chapter_title, manga_dir)
     
-    with ZipFile(cbz_path, 'w') as cbz_file:
-        for image in chapter_images:
-            cbz_file.write(image, os.path.basename(image))
+    with CbzWriter(cbz_path) as cbz_writer:
+        for name, img_data in chapter_images:
+            cbz_writer.add_page(name, img_data)
+        cbz_writer.commit()
     
     print(f"CBZ file created: {cbz_path}")
+    return cbz_path
+
+def find_loose_images(manga_dir):
+    # Pages left behind by versions that wrote NNN.jpg next to the CBZ files
+    return [os.path.join(manga_dir, name) for name in os.listdir(manga_dir) if re.fullmatch(r"\d{3}\.jpg", name)]
 
-    
 def delete_images(image_paths):
     for img_path in image_paths:
         if os.path.exists(img_path):
             os.remove(img_path)
-    print(f"Deleted {len(image_paths)} images after creating CBZ.")
-
-def download_manga_chapter(manga_url, manga_title, chapter_title, manga_dir):
-    os.makedirs(manga_dir, exist_ok=True)
-    download_chapter_images(manga_url, manga_title, chapter_title, manga_dir)
-
-
-
-
-
-
-
-
-
-
+    if image_paths:
+        print(f"Deleted {len(image_paths)} leftover page images.")
+
+@dataclass
+class SeriesJob:
+    url: str
+    manga_title: str = None
+    series_page: SeriesPage = None  # Already fetched by the update check or the preflight
+    update: bool = False  # Updates skip the cover and the saved page copy
+    chapter_urls: set = None  # Only these chapters, when the preflight trimmed the job
+
+@dataclass
+class ChapterJob:
+    manga_title: str
+    manga_dir: str
+    chapter_url: str
+    chapter_title: str
+    completed: bool = False
+    profile_name: str = None  # The series' output profile unless set
+    referer: str = None  # The series page, sent as the Referer of the chapter's requests
+    # Set by the URL stage; afterwards the writer is only touched by the packer
+    manifest: ChapterManifest = None
+    cbz_writer: CbzWriter = None
+    servers: ChapterServers = None
+    pending: int = 0
+    unpacked: deque = None  # Page numbers still to pack, in reading order
+    ready: dict = None  # Pages that arrived before an earlier page, by page number
+    started_at: float = 0.0
+    done: threading.Event = field(default_factory=threading.Event, repr=False)  # Set once the chapter is over
+
+class RunBudget:
+    """Wall-clock and byte limits of one run; chapters are only started while neither is used up.
+
+    The deadline is wall-clock time and the byte count may live in a multiprocessing
+    Value, so worker processes started at different times share one budget.
+    """
+
+    def __init__(self, seconds=None, max_bytes=None, deadline=None, counter=None):
+        self.deadline = deadline or (time.time() + seconds if seconds else None)
+        self.max_bytes = max_bytes
+        self.counter = counter  # Shared with worker processes; a plain int is enough for one process
+        self._lock = counter.get_lock() if counter is not None else threading.Lock()
+        self._spent = 0
+
+    @property
+    def spent_bytes(self):
+        return self.counter.value if self.counter is not None else self._spent
+
+    def charge(self, nbytes):
+        with self._lock:
+            if self.counter is not None:
+                self.counter.value += nbytes
+            else:
+                self._spent += nbytes
+
+    def exhausted(self):
+        """Which budget is used up, or None while chapters may still start."""
+        if self.deadline is not None and time.time() >= self.deadline:
+            return "time budget"
+        if self.max_bytes is not None and self.spent_bytes >= self.max_bytes:
+            return "byte budget"
+        return None
+
+class ChapterScheduler:
+    """Hands queued chapters to the URL stage, taking turns between series.
+
+    New chapters of series that are already in the library go first, one series after
+    another, so a long backfill can't hold back the latest chapter of anything else.
+    Backfill waits until every series has been discovered and then always comes from the
+    series that has started the fewest chapters this run. Page bytes would arrive too late
+    to steer by: a chapter is handed out long before its pages are in. Once the run budget
+    is used up no more chapters start; the rest stay on the site for the next run.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.deferred = []  # Chapters the budget left for the next run
+        self.stop_reason = None
+        self._cond = threading.Condition()
+        self._series = {}  # manga title -> {"new": deque, "backfill": deque, "started": int, "turn": int}
+        self._turns = itertools.count()
+        self._stops = 0
+        self._discovered = False  # Set by the first stop signal
+
+    def add(self, manga_title, new=(), backfill=()):
+        with self._cond:
+            series = self._series.setdefault(manga_title, {"new": deque(), "backfill": deque(), "started": 0, "turn": -1})
+            series["new"].extend(new)
+            series["backfill"].extend(backfill)
+            self._cond.notify_all()
+
+    def put(self, item):
+        """Queue-style stop signal from the pipeline: after the queued chapters, one chapter worker gets None.
+
+        The pipeline only sends these once the series stage has drained, so no more chapters are coming.
+        """
+        with self._cond:
+            self._stops += 1
+            self._discovered = True
+            self._cond.notify_all()
+
+    def get(self):
+        with self._cond:
+            while True:
+                chapter = self._next_locked()
+                if chapter is not None:
+                    return chapter
+                if self._stops:
+                    self._stops -= 1
+                    return None
+                self._cond.wait()
+
+    def take(self):
+        """The next chapter if one may start now, without waiting; None otherwise."""
+        with self._cond:
+            return self._next_locked()
+
+    @property
+    def finished(self):
+        """Every series has been discovered and nothing is left to hand out."""
+        with self._cond:
+            return self._discovered and not any(series[tier] for series in self._series.values()
+                                                for tier in ("new", "backfill"))
+
+    def wait_queued(self, count):
+        """Wait until `count` chapters are queued or discovery is over; returns how many are queued."""
+        with self._cond:
+            while True:
+                queued = sum(len(series[tier]) for series in self._series.values() for tier in ("new", "backfill"))
+                if queued >= count or self._discovered:
+                    return queued
+                self._cond.wait()
+
+    def _next_locked(self):
+        reason = self.budget.exhausted()
+        if reason:
+            for series in self._series.values():
+                for tier in ("new", "backfill"):
+                    self.deferred.extend(series[tier])
+                    series[tier].clear()
+            if self.deferred and self.stop_reason is None:
+                self.stop_reason = reason
+                print(f"Run {reason} used up; no further chapters are started.")
+            return None
+        # New chapters by plain turns, then backfill by chapters started so far
+        tiers = [("new", lambda series: series["turn"])]
+        if self._discovered:
+            tiers.append(("backfill", lambda series: (series["started"], series["turn"])))
+        for tier, rank in tiers:
+            waiting = [series for series in self._series.values() if series[tier]]
+            if waiting:
+                series = min(waiting, key=rank)
+                series["turn"] = next(self._turns)
+                series["started"] += 1
+                return series[tier].popleft()
+        return None
+
+class PageQueue:
+    """The fetch stage's inbox: bounded for new pages, with pages sent back by the transcode stage going first.
+
+    A page whose body turned out unusable comes back to be fetched from another server.
+    Sending one back never blocks, so the transcode stage can't deadlock against a full
+    fetch stage, and the stop signals are held back while a page that was taken from
+    here could still come back.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._cond = threading.Condition()
+        self._pages = deque()
+        self._retries = deque()
+        self._out = 0  # Pages handed to a fetch worker and not yet packed or sent back
+        self._stops = 0
+
+    def put(self, item):
+        with self._cond:
+            if item is None:
+                self._stops += 1
+            else:
+                while len(self._pages) >= self.maxsize:
+                    self._cond.wait()
+                self._pages.append(item)
+            self._cond.notify_all()
+
+    def retry(self, item):
+        with self._cond:
+            self._out -= 1
+            self._retries.append(item)
+            self._cond.notify_all()
+
+    def settle(self):
+        """A page taken from here has reached the packer."""
+        with self._cond:
+            self._out -= 1
+            self._cond.notify_all()
+
+    def get(self):
+        with self._cond:
+            while True:
+                if self._retries or self._pages:
+                    self._out += 1
+                    item = (self._retries or self._pages).popleft()
+                    self._cond.notify_all()
+                    return item
+                if self._stops and not self._out:
+                    self._stops -= 1
+                    return None
+                self._cond.wait()
+
+class DownloadPipeline:
+    """Series discovery -> image URL extraction -> page fetch -> transcode/validate -> CBZ commit.
+
+    Each stage has its own worker threads and hands work to the next through a bounded
+    queue, so a stage that falls behind makes the earlier ones wait instead of piling
+    pages up in memory. While one chapter is being packed, the next one's pages are
+    already downloading. Only the single packer thread writes to the CBZ files.
+    Chapters wait in a ChapterScheduler rather than a plain queue, which picks the next
+    one fairly across series and stops starting chapters once the run budget is spent.
+    A page that fails to decode goes back to the fetch stage for another server.
+    """
+
+    def __init__(self, budget=None):
+        self.budget = budget or RunBudget()
+        self.series_queue = queue.Queue(maxsize=pipeline_queue_size)
+        # Unbounded, but only holds the ChapterJobs; the URL stage pulls from it as fast as pages drain
+        self.chapter_queue = ChapterScheduler(self.budget)
+        self.fetch_queue = PageQueue(pipeline_queue_size)
+        self.transcode_queue = queue.Queue(maxsize=pipeline_queue_size)
+        self.pack_queue = queue.Queue(maxsize=pipeline_queue_size)
+        self.chapters = []
+        self._threads = []
+        self._stages = [
+            ("series", series_workers, self.series_queue, self._discover),
+            ("chapter", chapter_workers, self.chapter_queue, self._resolve),
+            ("fetch", page_workers, self.fetch_queue, self._fetch),
+            ("transcode", transcode_workers, self.transcode_queue, self._transcode),
+            ("pack", 1, self.pack_queue, self._pack),
+        ]
+
+    def run(self, series_jobs=(), chapter_jobs=()):
+        """Push the jobs through every stage and return the chapters that were attempted."""
+        self.start()
+        for series_job in series_jobs:
+            self.series_queue.put(series_job)
+        for chapter in chapter_jobs:
+            self.submit(chapter)
+        self.close()
+        return self.chapters
+
+    def discover(self, series_jobs):
+        """Run only the series stage: queue the chapters of every series for someone else to take."""
+        self._threads = [[threading.Thread(target=self._worker, args=("series", self.series_queue, self._discover),
+                                           name=f"series-{n}", daemon=True) for n in range(series_workers)]]
+        for thread in self._threads[0]:
+            thread.start()
+        for series_job in series_jobs:
+            self.series_queue.put(series_job)
+        for thread in self._threads[0]:
+            self.series_queue.put(None)
+        for thread in self._threads[0]:
+            thread.join()
+        self.chapter_queue.put(None)  # Every series is in; backfill may start
+
+    def start(self):
+        self._threads = [[threading.Thread(target=self._worker, args=(name, inbox, handle), name=f"{name}-{n}",
+                                           daemon=True)
+                          for n in range(workers)] for name, workers, inbox, handle in self._stages]
+        for stage_threads in self._threads:
+            for thread in stage_threads:
+                thread.start()
+
+    def submit(self, chapter):
+        """Queue a single chapter; chapter.done is set once it is over."""
+        self.chapter_queue.add(chapter.manga_title, new=[chapter])  # Repairs go ahead of any backfill
+
+    def close(self):
+        """Wait for everything queued to finish and stop the stage threads."""
+        # Close the stages front to back: once a stage has drained, nothing can feed the next one
+        for (name, workers, inbox, handle), stage_threads in zip(self._stages, self._threads):
+            for _ in stage_threads:
+                inbox.put(None)
+            for thread in stage_threads:
+                thread.join()
+        self.report_deferred()
+
+    def report_deferred(self):
+        deferred = self.chapter_queue.deferred
+        if deferred:
+            metrics.count("chapters_deferred", len(deferred))
+            print(f"{len(deferred)} chapter(s) of {len({chapter.manga_title for chapter in deferred})} series "
+                  "left for the next run.")
+
+    def _worker(self, name, inbox, handle):
+        while True:
+            item = inbox.get()
+            if item is None:
+                return
+            try:
+                handle(item)
+            except Exception as e:
+                print(f"Unexpected error in the {name} stage: {e}")
+
+    @metrics.timed("series_discovery")
+    def _discover(self, series_job):
+        url = series_job.url
+        series_page = series_job.series_page
+        if series_page is None:
+            # The HTTP cache keeps this page for the alternative-title lookup as well
+            try:
+                series_page = parse_series_page(fetch_page(get_http_session(), url).text, url)
+            except requests.exceptions.RequestException as e:
+                print(f"Failed to fetch the manga page. Error: {e}")
+                return
+
+        manga_title = sanitize_filename(series_job.manga_title or series_page.title)
+        if not manga_title.strip():
+            # Without a title the series folder would be the library root itself
+            print(f"No series title found at {url}; skipping it. Is it a series page?")
+            return
+        print(f"{'Updating' if series_job.update else 'Processing'} Manga: {manga_title}")
+        manga_dir = os.path.join(base_dir, manga_title)
+        os.makedirs(manga_dir, exist_ok=True)
+        register_series(manga_title, url)
+        delete_images(find_loose_images(manga_dir))
+
+        if not series_job.update:
+            save_url(manga_dir, url)
+            # Download cover image from both MangaDex and alternative source
+            alt_site_url = "https://manganelo.com/manga-hero-x-demon-queen"
+            extract_and_download_cover(manga_dir, series_page, manga_title, alt_site_url)
+
+        print(f"Number of chapters found: {len(series_page.chapters)}")
+        selected = set(select_chapters(series_page.chapters))
+        if len(selected) < len(series_page.chapters):
+            print(f"{len(selected)} of them selected by the chapter range or --latest.")
+        known_chapters = downloaded_chapters(manga_title)
+        # Chapters listed above the newest downloaded one are new; every other pending chapter is backfill
+        new, backfill = [], []
+        tier = new if any(known_chapters) else backfill
+        for chapter_url, chapter_title in series_page.chapters:
+            if is_chapter_downloaded(known_chapters, chapter_url, get_cbz_path(manga_title, chapter_title, manga_dir)):
+                tier = backfill
+                if (chapter_url, chapter_title) in selected:
+                    print(f"Chapter {chapter_title} already downloaded. Skipping...")
+                continue
+            if (chapter_url, chapter_title) not in selected:
+                continue
+            if series_job.chapter_urls is not None and chapter_url not in series_job.chapter_urls:
+                print(f"Chapter {chapter_title} left out to save disk space. Skipping...")
+                continue
+            print(f"Queued Chapter: {chapter_title} | URL: {chapter_url}")
+            tier.append(ChapterJob(manga_title, manga_dir, chapter_url, chapter_title, referer=url))
+        if chapter_order == "oldest":
+            new.reverse()
+            backfill.reverse()
+        self.chapter_queue.add(manga_title, new, backfill)
+
+    def _resolve(self, chapter):
+        self.chapters.append(chapter)  # Only chapters the scheduler handed out count as attempted
+        chapter.started_at = time.perf_counter()
+        queued = False
+        try:
+            queued = self._queue_pages(chapter)
+        finally:
+            if not queued:
+                chapter.done.set()  # Nothing reaches the packer, which would otherwise set it
+
+    def _queue_pages(self, chapter):
+        print(f"Processing Chapter: {chapter.chapter_title} | URL: {chapter.chapter_url}")
+        chapter.servers = ChapterServers(chapter.chapter_url, chapter.referer)
+        primary_urls = chapter.servers.primary_urls
+        if not primary_urls:
+            print(f"No images found on any server for {chapter.chapter_title}.")
+            metrics.count("chapters_incomplete")
+            return False
 
+        chapter.profile_name = chapter.profile_name or series_profile(chapter.manga_title)
+        cbz_path = get_cbz_path(chapter.manga_title, chapter.chapter_title, chapter.manga_dir)
+        chapter.manifest = ChapterManifest(cbz_path, chapter.chapter_url)
+        # Pick up an interrupted attempt only if the chapter still has the same pages, made the same way
+        resume = (chapter.manifest.page_total == len(primary_urls)
+                  and chapter.manifest.profile_name == chapter.profile_name)
+        if not resume:
+            chapter.manifest.reset()
+        chapter.manifest.page_total = len(primary_urls)
+        chapter.manifest.profile_name = chapter.profile_name
+        chapter.manifest.save()
+        chapter.cbz_writer = CbzWriter(cbz_path, resume=resume, profile_name=chapter.profile_name, keep_partial=True)
+        if chapter.cbz_writer.page_count:
+            print(f"Resuming with {chapter.cbz_writer.source_page_count}/{chapter.manifest.page_total} pages already saved.")
+
+        missing = [idx for idx in range(1, len(primary_urls) + 1) if not chapter.cbz_writer.has_page(f"{idx:03}.jpg")]
+        # One count per page plus the end-of-chapter marker, so the packer knows when it has seen everything
+        chapter.pending = len(missing) + 1
+        chapter.unpacked = deque(missing)
+        chapter.ready = {}
+        for idx in missing:
+            self.fetch_queue.put((chapter, idx, frozenset()))
+        self.pack_queue.put((chapter, None, None))
+        return True
 
+    def _fetch(self, item):
+        chapter, idx, tried = item  # `tried`: servers whose copy of the page turned out broken
+        save_name = f"{idx:03}.jpg"
+        try:
+            if tried:
+                print(f"Trying another server for {save_name}...")
+            else:
+                for server_index, img_url in chapter.servers.read_candidates(idx):
+                    stored = stored_page(img_url, chapter.profile_name)
+                    if stored is not None:
+                        self._packed(chapter, idx, stored)
+                        return
+            # The mirror with the best recent first-byte times goes first; the others hedge it
+            fetched = fetch_hedged(chapter.servers.candidates(idx, exclude=tried), save_name, chapter.manifest,
+                                   chapter.referer)
+            if fetched is not None:
+                server_index, img_url, img_data = fetched
+                self.budget.charge(len(img_data))
+                if server_index:
+                    metrics.count("server_switches")
+                self.transcode_queue.put((chapter, idx, tried, server_index, img_url, img_data))
+                return
+        except Exception as e:
+            print(f"Failed to fetch {save_name} of {chapter.chapter_title}: {e}")
+        self._packed(chapter, idx, None)
+
+    def _transcode(self, item):
+        chapter, idx, tried, server_index, img_url, img_data = item
+        save_name = f"{idx:03}.jpg"
+        try:
+            page_data = prepare_page(img_url, save_name, img_data, chapter.profile_name)
+        except Exception as e:
+            print(f"Failed to process {save_name} of {chapter.chapter_title}: {e}")
+            self._packed(chapter, idx, None)
+            return
+        if page_data is None:
+            # Broken image; the fetch stage tries the other servers and gives up once none is left
+            self.fetch_queue.retry((chapter, idx, tried | {server_index}))
+        else:
+            self._packed(chapter, idx, page_data)
 
+    def _packed(self, chapter, idx, page_data):
+        """Hand a page (None if it failed) to the packer; the fetch stage is done with it."""
+        self.pack_queue.put((chapter, idx, page_data))
+        self.fetch_queue.settle()
 
+    def _pack(self, item):
+        chapter, idx, page_data = item
+        try:
+            if idx is not None:
+                chapter.ready[idx] = page_data
+            # Pages go into the archive in reading order; one that finished early waits here for those before it
+            while chapter.unpacked and chapter.unpacked[0] in chapter.ready:
+                idx = chapter.unpacked.popleft()
+                page_data = chapter.ready.pop(idx)
+                if page_data:
+                    save_name = f"{idx:03}.jpg"
+                    chapter.cbz_writer.add_page(save_name, page_data)
+                    chapter.manifest.mark_finished(save_name)
+        finally:
+            chapter.pending -= 1
+            if chapter.pending == 0:
+                self._finish(chapter)
+
+    def _finish(self, chapter):
+        cbz_writer, manifest = chapter.cbz_writer, chapter.manifest
+        try:
+            if cbz_writer.source_page_count == manifest.page_total:
+                cbz_writer.commit()
+                manifest.discard()
+                print(f"CBZ file created: {cbz_writer.cbz_path}")
+                record_chapter(chapter.manga_title, chapter.chapter_url, chapter.chapter_title,
+                               cbz_writer.cbz_path, cbz_writer.page_count, profile_name=chapter.profile_name)
+                chapter.completed = True
+                metrics.count("chapters_completed")
+            else:
+                print(f"Chapter {chapter.chapter_title} incomplete ({cbz_writer.source_page_count}/{manifest.page_total} pages); "
+                      "progress kept for the next run.")
+                metrics.count("chapters_incomplete")
+        finally:
+            for page_data in chapter.ready.values():  # Only left over when a page could not be written
+                if not isinstance(page_data, list):
+                    discard_body(page_data)
+            cbz_writer.close()
+            if metrics.enabled:
+                metrics.observe("chapter_download", time.perf_counter() - chapter.started_at)
+            chapter.done.set()
+
+_chapter_pipeline = None
+
+def get_chapter_pipeline():
+    """A pipeline left running for download_chapter_images, so each chapter doesn't start its own stage threads."""
+    global _chapter_pipeline
+    with _http_lock:
+        if _chapter_pipeline is None:
+            _chapter_pipeline = DownloadPipeline()
+            _chapter_pipeline.start()  # Daemon threads; they idle on empty queues until the process exits
+    return _chapter_pipeline
+
+def download_series(series_jobs):
+    """Download every queued series through one pipeline, so chapters of different series overlap.
+
+    With worker_processes above 1 the chapters are spread over that many processes instead.
+    run_time_budget and run_byte_budget cover the whole call, across every process.
+    """
+    if worker_processes > 1:
+        chapters = run_worker_processes(series_jobs, worker_processes)
+    else:
+        chapters = DownloadPipeline(RunBudget(run_time_budget, run_byte_budget)).run(series_jobs=series_jobs)
+    update_combined_log()  # Only the starting process writes the library summary
+    return chapters
+
+def run_worker_processes(series_jobs, processes):
+    """Download chapters in worker processes; returns the chapters attempted.
+
+    This process discovers the series and keeps the one ChapterScheduler, so new chapters
+    still go before backfill and series take turns across every worker. Each worker has
+    its own pipe and holds at most worker_chapters chapters, so this process always knows
+    which chapters every worker has. A worker that dies is replaced and its chapters
+    requeued, up to worker_max_attempts times each; the chapter resume manifests let the
+    retry pick up where the dead worker stopped.
+    """
+    context = multiprocessing.get_context("spawn")  # What Windows always does; never forks a process with threads
+    get_library_index()  # Import an existing library once, before several processes open the index
+    # One deadline and one byte count for every worker, including replacements started later
+    budget = RunBudget(run_time_budget, run_byte_budget, counter=context.Value("q", 0))
+    pipeline = DownloadPipeline(budget)  # Only its series stage runs here
+    scheduler = pipeline.chapter_queue
+    discovery = threading.Thread(target=pipeline.discover, args=(series_jobs,), name="discovery", daemon=True)
+    discovery.start()
+    # Start no more workers than there are chapters to give them
+    worker_count = min(processes, scheduler.wait_queued(processes))
+    if not worker_count:
+        discovery.join()
+        pipeline.report_deferred()
+        return []
+    settings = worker_process_settings(worker_count)
+    attempts = {}  # chapter URL -> times handed to a worker
+    workers = {}  # worker id -> (process, this end of its pipe)
+    holding = {}  # worker id -> {chapter id: the ChapterJob it is downloading}
+    chapters = []
+    worker_ids = itertools.count(1)
+    chapter_ids = itertools.count()
+    idle_deaths = 0  # Workers that died holding no chapters, e.g. failing to start at all
+
+    def start_worker():
+        worker_id = next(worker_ids)
+        parent_end, worker_end = context.Pipe()
+        worker = context.Process(target=chapter_worker, args=(worker_id, settings, worker_end, budget.counter),
+                                 name=f"chapter-worker-{worker_id}")
+        worker.start()
+        worker_end.close()  # Only the worker holds it now, so its death shows up as EOF here
+        workers[worker_id] = (worker, parent_end)
+        holding[worker_id] = {}
+
+    def receive(worker_id):
+        worker, conn = workers[worker_id]
+        try:
+            while conn.poll():
+                kind, *payload = conn.recv()
+                if kind == "chapter":
+                    n, chapter = payload
+                    holding[worker_id].pop(n, None)
+                    chapters.append(chapter)
+                else:
+                    counters, (store_hits, store_misses) = payload
+                    for name, value in counters.items():
+                        metrics.count(name, value)
+                    page_store = get_page_store()
+                    if page_store:
+                        page_store.hits += store_hits
+                        page_store.misses += store_misses
+        except (EOFError, OSError):
+            pass  # The worker is gone; the exit check requeues what it held
+
+    print(f"Downloading {len(series_jobs)} series in {worker_count} worker processes...")
+    for _ in range(worker_count):
+        start_worker()
+
+    while True:
+        # Hand out chapters in the scheduler's order to every worker with room for one
+        for worker_id, (worker, conn) in workers.items():
+            while len(holding[worker_id]) < worker_chapters:
+                chapter = scheduler.take()
+                if chapter is None:
+                    break
+                n = next(chapter_ids)
+                attempts[chapter.chapter_url] = attempts.get(chapter.chapter_url, 0) + 1
+                holding[worker_id][n] = chapter
+                try:
+                    conn.send((n, replace(chapter, done=None)))
+                except OSError:
+                    break  # Already dead; the exit check below requeues the chapter
+        if scheduler.finished and not any(holding.values()):
+            break
+        # The timeout picks up chapters discovery queued while every worker was busy or idle
+        multiprocessing.connection.wait([conn for _, conn in workers.values()]
+                                        + [worker.sentinel for worker, _ in workers.values()], timeout=0.2)
+        for worker_id in list(workers):
+            receive(worker_id)  # Results first, so a worker that finished and then exited isn't counted as a crash
+
+        for worker_id, (worker, conn) in list(workers.items()):
+            if worker.exitcode is None:
+                continue
+            receive(worker_id)
+            del workers[worker_id]
+            conn.close()
+            held = holding.pop(worker_id)
+            if not held:
+                idle_deaths += 1
+                continue
+            metrics.count("worker_crashes")
+            print(f"Worker {worker_id} died (exit code {worker.exitcode}) holding {len(held)} chapter(s).")
+            for chapter in held.values():
+                if attempts[chapter.chapter_url] < worker_max_attempts:
+                    print(f"Requeueing {chapter.manga_title} {chapter.chapter_title}")
+                    scheduler.add(chapter.manga_title, new=[chapter])  # Ahead of backfill, like a repair
+                else:
+                    print(f"Giving up on {chapter.manga_title} {chapter.chapter_title}")
+        if idle_deaths > worker_count * worker_max_attempts:
+            print("Worker processes keep exiting on their own; the remaining chapters are not downloaded.")
+            break
+        # Replace dead workers while there is still work for them
+        while len(workers) < worker_count and not scheduler.finished:
+            start_worker()
 
-def download_manga(url, manga_title=None):
-    headers['Referer'] = url
+    for worker, conn in workers.values():
+        try:
+            conn.send(None)
+        except OSError:
+            pass
+    for worker_id, (worker, conn) in workers.items():
+        worker.join()
+        receive(worker_id)  # The worker's counters
+        conn.close()
+    discovery.join()
+    pipeline.report_deferred()
+    return chapters
+
+def worker_process_settings(worker_count):
+    """Settings for a worker process: this process's configuration with the shared budgets split between the workers.
+
+    Each worker gets an equal share of the per-host pacing, the transcode processes and
+    the browsers, so N workers together treat a host and the CPU like one process does.
+    """
+    settings = {name: globals()[name] for name in worker_settings}
+    settings.update(
+        host_rate_limit=host_rate_limit / worker_count,
+        host_min_rate=host_min_rate / worker_count,
+        host_max_rate=host_max_rate / worker_count,
+        max_connections_per_host=max(1, max_connections_per_host // worker_count),
+        host_max_concurrency=max(1, host_max_concurrency // worker_count),
+        transcode_workers=max(1, transcode_workers // worker_count),
+        driver_pool_size=max(1, driver_pool_size // worker_count),
+        update_check_workers=max(1, update_check_workers // worker_count),
+    )
+    return settings
+
+def chapter_worker(worker_id, settings, conn, bytes_counter=None):
+    """Entry point of a worker process: download each chapter sent down `conn` until it sends None.
+
+    The chapters share one pipeline, so the next chapter's pages download while this one is packed.
+    """
+    global driver_pool
+    apply_settings(settings)
+    # The import-time pool was sized before this worker's share of the browsers was known
+    driver_pool = DriverPool(driver_pool_size, driver_max_uses)
+    atexit.register(driver_pool.close)
+    # The starting process checks the budget before handing out a chapter; here it is only charged
+    pipeline = DownloadPipeline(RunBudget(counter=bytes_counter))
+    pipeline.start()
+    running = {}  # chapter id -> ChapterJob
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        html_content = response.text
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to fetch the manga page. Error: {e}")
-        return
-
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    if not manga_title:
-        title_tag = soup.find('div', class_='story-info-right').find('h1')
-        manga_title = title_tag.text.strip()
-
-    print(f"Processing Manga: {manga_title}")
-    manga_title = sanitize_filename(manga_title)
+        while True:
+            if conn.poll(0.1):
+                try:
+                    item = conn.recv()
+                except EOFError:
+                    return  # The starting process is gone
+                if item is None:
+                    break
+                n, chapter = item
+                chapter = replace(chapter, done=threading.Event())
+                running[n] = chapter
+                pipeline.submit(chapter)
+            for n, chapter in list(running.items()):
+                if chapter.done.is_set():
+                    del running[n]
+                    # Open archives and manifests stay behind; the starting process only needs the outcome
+                    conn.send(("chapter", n, replace(chapter, manifest=None, cbz_writer=None, servers=None,
+                                                     unpacked=None, ready=None, done=None)))
+        pipeline.close()
+        page_store = _page_store
+        conn.send(("counters", metrics.summary()["counters"],
+                   (page_store.hits, page_store.misses) if page_store else (0, 0)))
+    finally:
+        # Child processes skip atexit, which is what shuts down the transcode pool, browsers and caches
+        atexit._run_exitfuncs()
 
-    manga_dir = os.path.join(base_dir, manga_title)
+def download_manga_chapter(manga_url, manga_title, chapter_title, manga_dir):
     os.makedirs(manga_dir, exist_ok=True)
+    download_chapter_images(manga_url, manga_title, chapter_title, manga_dir)
 
-    save_url(manga_dir, url)
-    html_file_path = save_html_as_txt(manga_dir, html_content)
-
-    # Process and download chapters
-    chapter_list = soup.find('ul', class_='row-content-chapter')
-    chapter_links = chapter_list.find_all('li', class_='a-h')
-
-    print(f"Number of chapters found: {len(chapter_links)}")
-
-    log_file_path = os.path.join(manga_dir, "download_log.txt")
-
-    existing_log = {}
-    if os.path.exists(log_file_path):
-        with open(log_file_path, "r", encoding="utf-8") as log_file:
-            for line in log_file:
-                chapter_url, chapter_title, last_updated = line.strip().split("\t")
-                existing_log[chapter_url] = (chapter_title, last_updated)
-
-    total_download_size = 0
-
-    for chapter_item in chapter_links:
-        link = chapter_item.find('a', class_='chapter-name text-nowrap')
-        chapter_url = urljoin(url, link['href'])  # Ensure the chapter URL is absolute
-        chapter_title = link.text.strip()
-
-        if chapter_url in existing_log:
-            print(f"Chapter {chapter_title} already downloaded. Skipping...")
-            continue
-
-        print(f"Processing Chapter: {chapter_title} | URL: {chapter_url}")
-        
-        # Download and process chapter images with server switching
-        download_chapter_images(chapter_url, manga_title, chapter_title, manga_dir)
-
-    update_combined_log()
-
-def download_manga(url, manga_title=None):
-    headers['Referer'] = url
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        html_content = response.text
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to fetch the manga page. Error: {e}")
-        return
-
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    if not manga_title:
-        title_tag = soup.find('div', class_='story-info-right').find('h1')
-        manga_title = title_tag.text.strip()
 
-    print(f"Processing Manga: {manga_title}")
-    manga_title = sanitize_filename(manga_title)
 
-    manga_dir = os.path.join(base_dir, manga_title)
-    os.makedirs(manga_dir, exist_ok=True)
 
-    save_url(manga_dir, url)
-    html_file_path = save_html_as_txt(manga_dir, html_content)
 
-    # Download cover image from both MangaDex and alternative source
-    alt_site_url = "https://manganelo.com/manga-hero-x-demon-queen"
-    extract_and_download_cover(manga_dir, html_content, url, manga_title, alt_site_url)
 
-    # Process and download chapters
-    chapter_list = soup.find('ul', class_='row-content-chapter')
-    chapter_links = chapter_list.find_all('li', class_='a-h')
 
-    print(f"Number of chapters found: {len(chapter_links)}")
 
-    log_file_path = os.path.join(manga_dir, "download_log.txt")
 
-    existing_log = {}
-    if os.path.exists(log_file_path):
-        with open(log_file_path, "r", encoding="utf-8") as log_file:
-            for line in log_file:
-                chapter_url, chapter_title, last_updated = line.strip().split("\t")
-                existing_log[chapter_url] = (chapter_title, last_updated)
 
-    total_download_size = 0
 
-    for chapter_item in chapter_links:
-        link = chapter_item.find('a', class_='chapter-name text-nowrap')
-        chapter_url = urljoin(url, link['href'])
-        chapter_title = link.text.strip()
 
-        if chapter_url in existing_log:
-            print(f"Chapter {chapter_title} already downloaded. Skipping...")
-            continue
 
-        print(f"Processing Chapter: {chapter_title} | URL: {chapter_url}")
-        download_chapter_images(chapter_url, manga_title, chapter_title, manga_dir)
 
-    print(f"Total estimated download size: {total_download_size / (1024 * 1024):.2f} MB")
 
-    update_combined_log()
+def download_manga(url, manga_title=None):
+    series_jobs = [SeriesJob(url, manga_title)]
+    if preflight_enabled:
+        series_jobs = preflight_check(series_jobs)  # Prints the total estimated download size
+        if series_jobs is None:
+            return []
+    return download_series(series_jobs)
 
 def update_combined_log():
     combined_log_path = os.path.join(base_dir, "combined_download_log.txt")
-
-    with open(combined_log_path, "w", encoding="utf-8") as combined_log:
-        combined_log.write(f"{'Manga Title':<30} {'Total Chapters':<15} {'Last Updated':<25}\n")
-        combined_log.write("="*70 + "\n")
-        
-        for manga_folder in os.listdir(base_dir):
-            manga_path = os.path.join(base_dir, manga_folder)
-            if os.path.isdir(manga_path):
-                log_file = os.path.join(manga_path, "download_log.txt")
-                
-                if os.path.exists(log_file):
-                    with open(log_file, "r", encoding="utf-8") as individual_log:
-                        chapters = individual_log.readlines()
-                        if chapters:
-                            last_updated = chapters[-1].strip().split("\t")[-1]
-                            combined_log.write(f"{manga_folder:<30} {len(chapters):<15} {last_updated:<25}\n")
+    conn = get_library_index()
+
+    # Worker processes leave the summary to the process that started them; the lock covers separate runs
+    with file_lock(combined_log_path + ".lock"):
+        # Only rewrite the summary when a chapter was committed since the last write
+        if get_library_meta("summary_dirty") != "1" and os.path.exists(combined_log_path):
+            return
+
+        with _library_lock, conn:
+            # Cleared before reading, so a chapter committed meanwhile marks it dirty again
+            _set_library_meta(conn, "summary_dirty", "0")
+            rows = conn.execute(
+                "SELECT series.folder, COUNT(chapters.id), MAX(chapters.completed_at) FROM series "
+                "JOIN chapters ON chapters.series_id = series.id GROUP BY series.id ORDER BY series.folder").fetchall()
+
+        temp_path = f"{combined_log_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as combined_log:
+            combined_log.write(f"{'Manga Title':<30} {'Total Chapters':<15} {'Last Updated':<25}\n")
+            combined_log.write("="*70 + "\n")
+
+            for manga_folder, chapter_count, last_updated in rows:
+                combined_log.write(f"{manga_folder:<30} {chapter_count:<15} {last_updated or '':<25}\n")
+        os.replace(temp_path, combined_log_path)
 
 def list_manga_folders():
-    manga_folders = [folder for folder in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, folder))]
+    manga_folders = series_folders()
     print("Available Manga Titles:")
     for index, folder in enumerate(manga_folders, 1):
         print(f"{index}. {folder}")
@@ -572,85 +3482,523 @@ def select_and_update_folders():
     else:
         selected_numbers = [int(num.strip()) for num in selected_numbers]
 
+    selected_folders = []
     for num in selected_numbers:
         if 1 <= num <= len(manga_folders):
-            manga_folder = manga_folders[num-1]
-            manga_folder_path = os.path.join(base_dir, manga_folder)
-            url_file_path = os.path.join(manga_folder_path, "url.txt")
-
-            if os.path.exists(url_file_path):
-                with open(url_file_path, "r", encoding="utf-8") as url_file:
-                    manga_page_url = url_file.read().strip()
-                print(f"Updating folder: {manga_folder}")
-                update_manga(manga_page_url, manga_title=manga_folder)
-            else:
-                print(f"URL file missing for folder '{manga_folder}'. Please enter the URL.")
-                new_url = input(f"Enter the URL for '{manga_folder}': ").strip()
-                save_url(manga_folder_path, new_url)
-                update_manga(new_url, manga_title=manga_folder)
+            selected_folders.append(manga_folders[num-1])
         else:
             print(f"Invalid selection: {num}. Skipping...")
-
-def update_manga(url, manga_title=None):
-    headers['Referer'] = url
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    html_content = response.text
-
-    if not manga_title:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        title_tag = soup.find('div', class_='story-info-right').find('h1')
-        manga_title = title_tag.text.strip()
-
-    print(f"Updating Manga: {manga_title}")
-
-    # Sanitize the manga title
-    manga_title = sanitize_filename(manga_title)
-
-    manga_dir = os.path.join(base_dir, manga_title)
-
-    soup = BeautifulSoup(html_content, 'html.parser')
-    chapter_list = soup.find('ul', class_='row-content-chapter')
-    chapter_links = chapter_list.find_all('li', class_='a-h')
-
-    print(f"Number of chapters found: {len(chapter_links)}")
-
-    log_file_path = os.path.join(manga_dir, "download_log.txt")
-
-    existing_log = {}
-    if os.path.exists(log_file_path):
-        with open(log_file_path, "r", encoding="utf-8") as log_file:
-            for line in log_file:
-                chapter_url, chapter_title, last_updated = line.strip().split("\t")
-                existing_log[chapter_url] = (chapter_title, last_updated)
-
-    total_download_size = 0
-
-    for chapter_item in chapter_links:
-        link = chapter_item.find('a', class_='chapter-name text-nowrap')
-        chapter_url = urljoin(url, link['href'])  # Ensure the chapter URL is absolute
-        chapter_title = link.text.strip()
-
-        if chapter_url in existing_log:
-            print(f"Chapter {chapter_title} already downloaded. Skipping...")
+    return update_folders(selected_folders)
+
+def update_folders(manga_folders, interactive=True):
+    """Download the new chapters of the given series folders; returns the chapters attempted."""
+    series_jobs = update_jobs(manga_folders, interactive)
+    if preflight_enabled and series_jobs:
+        series_jobs = preflight_check(series_jobs)
+        if series_jobs is None:
+            return []
+    return download_series(series_jobs)
+
+def update_jobs(manga_folders, interactive=True):
+    """SeriesJobs for the given folders that have new chapters, after a concurrent update check."""
+    series = []
+    for manga_folder in manga_folders:
+        manga_folder_path = os.path.join(base_dir, manga_folder)
+        url_file_path = os.path.join(manga_folder_path, "url.txt")
+
+        if os.path.exists(url_file_path):
+            with open(url_file_path, "r", encoding="utf-8") as url_file:
+                manga_page_url = url_file.read().strip()
+        elif interactive and os.path.isdir(manga_folder_path):
+            print(f"URL file missing for folder '{manga_folder}'. Please enter the URL.")
+            manga_page_url = input(f"Enter the URL for '{manga_folder}': ").strip()
+            save_url(manga_folder_path, manga_page_url)
+        else:
+            print(f"No url.txt for folder '{manga_folder}'. Skipping...")
             continue
+        series.append((manga_folder, manga_page_url))
+
+    # Cheap concurrent check first; only series with new chapters are downloaded, all in one pipeline
+    return [SeriesJob(manga_page_url, manga_folder, series_page, update=True)
+            for manga_folder, manga_page_url, series_page, new_chapters in check_for_updates(series)]
+
+async def _check_series(loop, executor, manga_folder, url):
+    # Parsing and the index lookups run in the executor too, so the loop only waits on results
+    return await loop.run_in_executor(executor, check_series, manga_folder, url)
+
+def check_series(manga_folder, url):
+    """Return the (folder, url, series_page, new_chapters) work item of one series, or None if nothing is new."""
+    # The HTTP cache makes this a conditional request; per-host concurrency is left to the host limiter
+    page = fetch_page(get_http_session(), url, timeout=20)
+    if (page.etag or page.last_modified) and (page.etag, page.last_modified) == get_series_validators(manga_folder):
+        return None  # The same version of the page had nothing new at an earlier check
+
+    series_page = parse_series_page(page.text, url)
+    new_chapters = pending_chapters(manga_folder, series_page)
+
+    if not new_chapters:
+        # Only remember validators once nothing is pending, so a failed download is re-checked next time;
+        # chapters left out by --chapters or --latest still count as pending
+        if not pending_chapters(manga_folder, series_page, selected=False):
+            save_series_validators(manga_folder, page.etag, page.last_modified)
+        return None
+    return manga_folder, url, series_page, new_chapters
+
+async def _check_for_updates(series):
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=update_check_workers) as executor:
+        tasks = [_check_series(loop, executor, manga_folder, url) for manga_folder, url in series]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+@metrics.timed("update_check")
+def check_for_updates(series):
+    """Fetch all series pages concurrently and return the ones with new chapters.
+
+    `series` is a list of (folder, url) pairs; the result is a list of
+    (folder, url, series_page, new_chapters) work items.
+    """
+    print(f"Checking {len(series)} series for new chapters...")
+    work_list = []
+    for (manga_folder, url), result in zip(series, asyncio.run(_check_for_updates(series))):
+        if isinstance(result, Exception):
+            print(f"Update check failed for {manga_folder}: {result}")
+        elif result:
+            print(f"{manga_folder}: {len(result[3])} new chapter(s)")
+            work_list.append(result)
+    print(f"{len(work_list)} of {len(series)} series have new chapters.")
+    return work_list
+
+@metrics.timed("update_series")
+def update_manga(url, manga_title=None, series_page=None):
+    return download_series([SeriesJob(url, manga_title, series_page, update=True)])
+
+@dataclass
+class SeriesEstimate:
+    series_job: SeriesJob
+    manga_title: str
+    pending: list  # (chapter URL, chapter title) not in the library yet, oldest first
+    sampled_chapters: int = 0
+    sampled_bytes: int = 0
+
+    @property
+    def chapter_bytes(self):
+        return self.sampled_bytes / self.sampled_chapters if self.sampled_chapters else 0
+
+    @property
+    def total_bytes(self):
+        return round(self.chapter_bytes * len(self.pending))
+
+def remote_size(img_url, referer):
+    """Size of an image from a HEAD request, or a one-byte ranged GET when HEAD doesn't tell; None if unknown."""
+    session = get_http_session()
+    request_headers = {'Referer': referer}
+    try:
+        with limited_request(session, "HEAD", img_url, headers=request_headers, timeout=10,
+                             allow_redirects=True) as response:
+            size = get_full_size(response, 0) if response.ok else None
+        if size is None:
+            request_headers['Range'] = 'bytes=0-0'
+            with limited_get(session, img_url, headers=request_headers, stream=True, timeout=10) as response:
+                size = get_full_size(response, 0) if response.ok else None
+    except requests.exceptions.RequestException:
+        return None
+    return size
+
+def sample_evenly(items, count):
+    if len(items) <= count:
+        return list(items)
+    return [items[round(n * (len(items) - 1) / max(1, count - 1))] for n in range(count)]
+
+def _series_estimate(series_job):
+    try:
+        if series_job.series_page is None:
+            series_job.series_page = parse_series_page(fetch_page(get_http_session(), series_job.url).text,
+                                                       series_job.url)
+    except requests.exceptions.RequestException as e:
+        print(f"Preflight could not fetch {series_job.url}: {e}")
+        return None
+    manga_title = sanitize_filename(series_job.manga_title or series_job.series_page.title)
+    if not manga_title.strip():
+        print(f"Preflight found no series title at {series_job.url}; it will be skipped.")
+        return None
+    return SeriesEstimate(series_job, manga_title, pending_chapters(manga_title, series_job.series_page)[::-1])
+
+def _primary_image_urls(chapter_url):
+    try:
+        return parse_chapter_page(fetch_page(get_http_session(), chapter_url).text, chapter_url).image_urls
+    except requests.exceptions.RequestException as e:
+        print(f"Preflight could not fetch {chapter_url}: {e}")
+        return []
 
-        print(f"Processing Chapter: {chapter_title} | URL: {chapter_url}")
-
-        # Download and process chapter images with server switching
-        download_chapter_images(chapter_url, manga_title, chapter_title, manga_dir)
-
-    update_combined_log()
-
-
-user_input = input("Enter the manga page URL or 'update' to select folders for update: ")
-
-if user_input.lower() == 'update':
-    select_and_update_folders()
-else:
-    download_manga(user_input)
-
-print(f"All selected chapters downloaded and saved in their respective directories.")
-print(f"Combined log file updated and saved at {os.path.join(base_dir, 'combined_download_log.txt')}")
-
-input("Press Enter to exit...")
\ No newline at end of file
+def estimate_jobs(series_jobs):
+    """Estimate the download size of each job's pending chapters; returns one SeriesEstimate per series."""
+    estimates = series_estimates(series_jobs)
+    sample_chapter_sizes(estimates)
+    return estimates
+
+def series_estimates(series_jobs):
+    """One unsized SeriesEstimate per series, listing its pending chapters; fetches only the series pages."""
+    with ThreadPoolExecutor(max_workers=preflight_workers) as executor:
+        return [estimate for estimate in executor.map(_series_estimate, series_jobs) if estimate]
+
+def sample_chapter_sizes(estimates):
+    """Size the estimates' chapters from their pages.
+
+    Pages of up to preflight_sample_chapters chapters per series, spread over the
+    pending ones, are sized with concurrent HEAD requests and the rest extrapolated.
+    """
+    with ThreadPoolExecutor(max_workers=preflight_workers) as executor:
+        samples = [(estimate, chapter_url) for estimate in estimates
+                   for chapter_url, _ in sample_evenly(estimate.pending, preflight_sample_chapters)]
+        sample_urls = list(executor.map(_primary_image_urls, [chapter_url for _, chapter_url in samples]))
+        head_requests = [(img_url, chapter_url) for (_, chapter_url), image_urls in zip(samples, sample_urls)
+                         for img_url in image_urls]
+        sizes = iter(executor.map(lambda args: remote_size(*args), head_requests))
+
+    for (estimate, _), image_urls in zip(samples, sample_urls):
+        known = [size for size in (next(sizes) for _ in image_urls) if size is not None]
+        if known:
+            # Pages that didn't report a size are assumed to be as large as the ones that did
+            estimate.sampled_bytes += sum(known) * len(image_urls) // len(known)
+            estimate.sampled_chapters += 1
+
+@metrics.timed("preflight")
+def preflight_check(series_jobs, space_policy=None, dry_run=False):
+    """Compare the jobs' size with the free space under base_dir.
+
+    The pending chapters are first counted at preflight_chapter_bytes each, which only
+    needs the series pages. Only when that bound doesn't fit, or for a dry run, are
+    chapter pages sized and the estimate reported per series. Returns the jobs to run:
+    all of them when they fit, trimmed to the oldest pending chapters that fit under
+    the "trim" policy, or None when the job is refused (and after a dry run).
+    """
+    space_policy = space_policy or preflight_space_policy
+    print(f"Preflight: checking the pending chapters of {len(series_jobs)} series...")
+    estimates = series_estimates(series_jobs)
+    os.makedirs(base_dir, exist_ok=True)
+    available = shutil.disk_usage(base_dir).free - preflight_reserve_bytes
+    page_store = get_page_store()
+    store_room = 0
+    if page_store and os.stat(page_store.root).st_dev == os.stat(base_dir).st_dev:
+        # The page store keeps a second copy of new pages until it reaches its own limit
+        store_room = max(0, page_store_max_bytes - page_store.total_bytes)
+
+    pending = sum(len(estimate.pending) for estimate in estimates)
+    bound = pending * preflight_chapter_bytes
+    if run_byte_budget is not None:
+        bound = min(bound, run_byte_budget)
+    if not dry_run and bound + min(bound, store_room) <= available:
+        print(f"{pending} pending chapter(s) fit with room to spare "
+              f"({max(0, available) / (1024 * 1024):,.0f} MB free after the reserve).")
+        return series_jobs
+    if not dry_run:
+        print("They might not fit; sizing their pages...")
+    sample_chapter_sizes(estimates)
+
+    print(f"{'Manga Title':<30} {'Pending':>8} {'Sampled':>8} {'Est. (MB)':>10}")
+    print("=" * 60)
+    for estimate in estimates:
+        sized = estimate.sampled_chapters or not estimate.pending
+        size = f"{estimate.total_bytes / (1024 * 1024):.1f}" if sized else "?"
+        print(f"{estimate.manga_title:<30} {len(estimate.pending):>8} {estimate.sampled_chapters:>8} {size:>10}")
+    print("=" * 60)
+    unsized = [estimate.manga_title for estimate in estimates if estimate.pending and not estimate.sampled_chapters]
+    if unsized:
+        print(f"No page sizes for {', '.join(unsized)}; they aren't counted in the estimate.")
+
+    total_bytes = sum(estimate.total_bytes for estimate in estimates)
+    store_bytes = min(total_bytes, store_room)
+    print(f"Total estimated download size: {total_bytes / (1024 * 1024):.2f} MB "
+          f"(+{store_bytes / (1024 * 1024):.2f} MB in the page store); "
+          f"{max(0, available) / (1024 * 1024):,.0f} MB free after the reserve")
+
+    needed = total_bytes + store_bytes
+    if run_byte_budget is not None and run_byte_budget < total_bytes:
+        # The run stops starting chapters after the budget, so only about that much lands on the drive
+        needed = needed * run_byte_budget / total_bytes
+        print(f"The byte budget limits this run to about {run_byte_budget / (1024 * 1024):.2f} MB of pages.")
+
+    if dry_run:
+        return None
+    if needed <= available:
+        return series_jobs
+    if space_policy != "trim":
+        print("Not enough free space under the library folder; nothing was downloaded. "
+              "Free up space or trim the job to what fits.")
+        return None
+
+    # Keep each series' oldest pending chapters, in order, while they still fit
+    scale = (total_bytes + store_bytes) / total_bytes if total_bytes else 1
+    budget = available
+    trimmed_jobs = []
+    for estimate in estimates:
+        chapter_bytes = estimate.chapter_bytes * scale
+        fitting = len(estimate.pending)
+        if chapter_bytes:
+            fitting = min(fitting, max(0, int(budget // chapter_bytes)))
+        budget -= fitting * chapter_bytes
+        if fitting < len(estimate.pending):
+            print(f"{estimate.manga_title}: keeping {fitting} of {len(estimate.pending)} pending chapter(s)")
+        if fitting:
+            estimate.series_job.chapter_urls = {chapter_url for chapter_url, _ in estimate.pending[:fitting]}
+            trimmed_jobs.append(estimate.series_job)
+    return trimmed_jobs
+
+
+# Check one archive; runs inside the verify process pool
+def verify_cbz(cbz_path, full=False):
+    """Return (cbz_path, problem or None, page count).
+
+    The quick check reads the central directory plus each page's header and, for
+    stored JPEGs, its last jpeg_tail_bytes. A full check also tests every CRC and decodes every page.
+    """
+    try:
+        with open(cbz_path, "rb") as raw_file, ZipFile(raw_file) as cbz_file:
+            pages = [info for info in cbz_file.infolist() if not info.is_dir()]
+            if not pages:
+                return cbz_path, "archive has no pages", 0
+            if full:
+                bad_entry = cbz_file.testzip()
+                if bad_entry:
+                    return cbz_path, f"CRC mismatch in {bad_entry}", len(pages)
+            for info in pages:
+                with cbz_file.open(info) as page_file:
+                    image_format, width, height = sniff_image_file(page_file)
+                if not image_format or not width or not height:
+                    return cbz_path, f"{info.filename} is not a readable image", len(pages)
+                if image_format == 'JPEG' and info.compress_type == ZIP_STORED and not full:
+                    # The same rule the download path checks pass-through pages with
+                    if not jpeg_tail_complete(_stored_entry_tail(raw_file, info, jpeg_tail_bytes)):
+                        return cbz_path, f"{info.filename} is truncated", len(pages)
+                if full:
+                    open_page_image(cbz_file.read(info))
+    except (BadZipFile, OSError, ValueError, EOFError, struct.error) as e:
+        return cbz_path, f"{type(e).__name__}: {e}", 0
+    return cbz_path, None, len(pages)
+
+def _stored_entry_tail(raw_file, info, count):
+    # Skip the local header to find where the stored bytes of this entry end
+    raw_file.seek(info.header_offset)
+    local_header = raw_file.read(30)
+    if local_header[:4] != b'PK\x03\x04':
+        raise BadZipFile(f"bad local header for {info.filename}")
+    name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+    data_start = info.header_offset + 30 + name_length + extra_length
+    raw_file.seek(data_start + max(0, info.compress_size - count))
+    return raw_file.read(min(count, info.compress_size))
+
+def verify_library(full=False, workers=None):
+    """Check every CBZ under base_dir, skipping archives unchanged since they last passed.
+
+    Broken or missing chapters are requeued: the archive is renamed to ".broken", its
+    index row is removed and the series' validators are cleared, so the next update
+    downloads the chapter again. Returns the folders with requeued chapters.
+    """
+    conn = get_library_index()
+    with _library_lock:
+        rows = conn.execute(
+            "SELECT series.folder, chapters.cbz_name, chapters.verified_mtime, chapters.verified_size, chapters.verified_full "
+            "FROM chapters JOIN series ON series.id = chapters.series_id").fetchall()
+    verified = {(folder, cbz_name): (mtime, size, was_full) for folder, cbz_name, mtime, size, was_full in rows}
+
+    to_check, unchanged, on_disk = [], 0, set()
+    for manga_folder in series_folders():
+        with os.scandir(os.path.join(base_dir, manga_folder)) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(".cbz") or not entry.is_file():
+                    continue
+                on_disk.add((manga_folder, entry.name))
+                stat = entry.stat()
+                mtime, size, was_full = verified.get((manga_folder, entry.name), (None, None, 0))
+                if mtime == stat.st_mtime and size == stat.st_size and (was_full or not full):
+                    unchanged += 1
+                    continue
+                to_check.append((manga_folder, entry.name, stat.st_mtime, stat.st_size))
+
+    print(f"Verifying {len(to_check)} archive(s) ({'full' if full else 'quick'} check); "
+          f"{unchanged} unchanged since their last check.")
+    broken = [(manga_folder, cbz_name, "file is missing") for manga_folder, cbz_name in verified if (manga_folder, cbz_name) not in on_disk]
+    if not to_check and not broken:
+        return []  # Nothing changed since the last check; don't start any worker processes
+    passed = []
+    start = time.perf_counter()
+    if to_check:
+        with metrics.span("verify"), spawned_process_pool(min(workers or verify_workers, len(to_check))) as executor:
+            paths = [os.path.join(base_dir, manga_folder, cbz_name) for manga_folder, cbz_name, _, _ in to_check]
+            results = executor.map(verify_cbz, paths, [full] * len(paths), chunksize=8)
+            for (manga_folder, cbz_name, mtime, size), (cbz_path, problem, page_count) in zip(to_check, results):
+                if problem:
+                    broken.append((manga_folder, cbz_name, problem))
+                else:
+                    passed.append((manga_folder, cbz_name, mtime, size, page_count))
+    metrics.count("archives_verified", len(to_check))
+
+    with _library_lock, conn:
+        for manga_folder, cbz_name, mtime, size, page_count in passed:
+            series_id = _series_id(conn, manga_folder)
+            # Archives added by hand get a row too, so they're skipped next time
+            conn.execute("INSERT OR IGNORE INTO chapters (series_id, title, cbz_name, pages, bytes, completed_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (series_id, os.path.splitext(cbz_name)[0], cbz_name, page_count, size,
+                          datetime.fromtimestamp(mtime).isoformat(timespec='seconds')))
+            conn.execute("UPDATE chapters SET verified_mtime = ?, verified_size = ?, verified_full = ? "
+                         "WHERE series_id = ? AND cbz_name = ?", (mtime, size, int(full), series_id, cbz_name))
+        for manga_folder, cbz_name, problem in broken:
+            series_id = _series_id(conn, manga_folder)
+            conn.execute("DELETE FROM chapters WHERE series_id = ? AND cbz_name = ?", (series_id, cbz_name))
+            conn.execute("UPDATE series SET etag = NULL, last_modified = NULL WHERE id = ?", (series_id,))
+            _set_library_meta(conn, "summary_dirty", "1")
+
+    for manga_folder, cbz_name, problem in broken:
+        cbz_path = os.path.join(base_dir, manga_folder, cbz_name)
+        print(f"Broken: {manga_folder}/{cbz_name}: {problem}")
+        log_error(os.path.join(base_dir, manga_folder), f"Verify failed for {cbz_name}: {problem}; queued for re-download")
+        if os.path.exists(cbz_path):
+            os.replace(cbz_path, cbz_path + ".broken")
+    metrics.count("archives_broken", len(broken))
+
+    print(f"Checked {len(to_check)} archive(s) in {time.perf_counter() - start:.1f}s: "
+          f"{len(passed)} OK, {len(broken)} broken or missing and queued for re-download.")
+    return sorted({manga_folder for manga_folder, _, _ in broken})
+
+def print_status():
+    """Print what the library index knows, without touching the network."""
+    conn = get_library_index()
+    with _library_lock:
+        rows = conn.execute(
+            "SELECT series.folder, COUNT(chapters.id), COALESCE(SUM(chapters.bytes), 0), MAX(chapters.completed_at), "
+            "series.profile FROM series LEFT JOIN chapters ON chapters.series_id = series.id "
+            "GROUP BY series.id ORDER BY series.folder").fetchall()
+
+    print(f"{'Manga Title':<30} {'Chapters':>8} {'Size (MB)':>10}  {'Last Updated':<20} {'Profile':<12}")
+    print("=" * 85)
+    for manga_folder, chapter_count, total_bytes, last_updated, profile_name in rows:
+        profile_name = profile_name or ("original" if chapter_count else "-")
+        print(f"{manga_folder:<30} {chapter_count:>8} {total_bytes / (1024 * 1024):>10.1f}  {last_updated or '-':<20} "
+              f"{profile_name:<12}")
+
+    unfinished = [name for manga_folder in series_folders()
+                  for name in os.listdir(os.path.join(base_dir, manga_folder)) if name.endswith(".cbz.part")]
+    print("=" * 85)
+    print(f"{len(rows)} series, {sum(row[1] for row in rows)} chapters, "
+          f"{sum(row[2] for row in rows) / (1024 ** 3):.2f} GB; {len(unfinished)} chapter(s) waiting to resume")
+
+def run_interactive():
+    user_input = input("Enter the manga page URL or 'update' to select folders for update: ")
+
+    if user_input.lower() == 'update':
+        select_and_update_folders()
+    else:
+        download_manga(user_input)
+
+    print("All selected chapters downloaded and saved in their respective directories.")
+    print(f"Combined log file updated and saved at {os.path.join(base_dir, 'combined_download_log.txt')}")
+    report_page_store()
+    export_metrics()
+
+    input("Press Enter to exit...")
+
+def main(argv=None):
+    """Command line entry point; without a subcommand the interactive prompts are used."""
+    global base_dir, output_profile, worker_processes, metrics_enabled
+    global chapter_range, chapter_latest, chapter_order, run_time_budget, run_byte_budget
+    parser = argparse.ArgumentParser(description="Download manga series as CBZ files and keep them up to date.")
+    parser.add_argument("--base-dir", help=f"library folder (default: {base_dir})")
+    parser.add_argument("--no-metrics", action="store_true", help="don't record or export run metrics")
+    parser.add_argument("--processes", type=int, help=f"worker processes to spread chapters over (default: {worker_processes})")
+    subparsers = parser.add_subparsers(dest="command")
+    job_options = argparse.ArgumentParser(add_help=False)
+    job_options.add_argument("--dry-run", action="store_true",
+                             help="only estimate the download size and check the free space")
+    job_options.add_argument("--trim", action="store_true",
+                             help="when the job doesn't fit on the drive, download the chapters that do")
+    job_options.add_argument("--no-preflight", action="store_true", help="skip the size estimate and space check")
+    job_options.add_argument("--chapters", metavar="RANGE",
+                             help='chapter numbers to download, e.g. "1-50" or "1-10,25,40-"')
+    job_options.add_argument("--latest", type=int, metavar="N", help="only the newest N chapters of each series")
+    job_options.add_argument("--order", choices=("newest", "oldest"),
+                             help=f"download each series' chapters newest or oldest first (default: {chapter_order})")
+    job_options.add_argument("--time-budget", type=float, metavar="MINUTES",
+                             help="start no further chapters after this many minutes")
+    job_options.add_argument("--byte-budget", type=float, metavar="MB",
+                             help="start no further chapters after downloading this many MB of pages")
+    download_parser = subparsers.add_parser("download", parents=[job_options],
+                                            help="download series and all of their chapters")
+    download_parser.add_argument("urls", nargs="+", metavar="URL", help="series page URL")
+    download_parser.add_argument("--profile", choices=sorted(output_profiles),
+                                 help=f"output profile for new series (default: {output_profile}); "
+                                      "series already in the library keep theirs")
+    update_parser = subparsers.add_parser("update", parents=[job_options],
+                                          help="download new chapters of series in the library")
+    update_parser.add_argument("folders", nargs="*", metavar="FOLDER", help="series folders to update")
+    update_parser.add_argument("--all", action="store_true", help="update every series in the library")
+    subparsers.add_parser("status", help="summarise the library without going online")
+    verify_parser = subparsers.add_parser("verify", help="check every CBZ and queue broken chapters for re-download")
+    verify_parser.add_argument("--full", action="store_true", help="also test CRCs and decode every page")
+    verify_parser.add_argument("--repair", action="store_true", help="re-download the broken chapters right away")
+    verify_parser.add_argument("--workers", type=int, help=f"processes to check with (default: {verify_workers})")
+    args = parser.parse_args(argv)
+
+    if args.base_dir:
+        base_dir = args.base_dir
+    if args.no_metrics:
+        metrics_enabled = False
+    if args.processes:
+        worker_processes = max(1, args.processes)
+
+    if args.command is None:
+        run_interactive()
+        return 0
+    if args.command == "status":
+        print_status()
+        return 0
+    if args.command == "verify":
+        requeued = verify_library(full=args.full, workers=args.workers)
+        chapters = update_folders(requeued, interactive=False) if args.repair and requeued else []
+        update_combined_log()
+        export_metrics()
+        failed = [chapter for chapter in chapters if not chapter.completed]
+        return 1 if failed or (requeued and not args.repair) else 0
+
+    if args.chapters:
+        try:
+            parse_chapter_range(args.chapters)
+        except ValueError as e:
+            parser.error(f"--chapters: not a chapter range: {args.chapters!r} ({e})")
+        chapter_range = args.chapters
+    if args.latest is not None:
+        if args.latest < 0:
+            parser.error(f"--latest: must be 0 or more, not {args.latest}")
+        chapter_latest = args.latest
+    if args.order:
+        chapter_order = args.order
+    if args.time_budget is not None:
+        run_time_budget = args.time_budget * 60
+    if args.byte_budget is not None:
+        run_byte_budget = args.byte_budget * 1024 * 1024
+
+    if args.command == "download":
+        if args.profile:
+            output_profile = args.profile
+        series_jobs = [SeriesJob(url) for url in args.urls]
+    else:
+        if not args.all and not args.folders:
+            update_parser.error("name the folders to update or pass --all")
+        series_jobs = update_jobs(series_folders() if args.all else args.folders, interactive=False)
+
+    if series_jobs and (args.dry_run or (preflight_enabled and not args.no_preflight)):
+        series_jobs = preflight_check(series_jobs, "trim" if args.trim else None, dry_run=args.dry_run)
+        if series_jobs is None:
+            return 0 if args.dry_run else 1
+    chapters = download_series(series_jobs)
+
+    report_page_store()
+    export_metrics()
+    failed = [chapter for chapter in chapters if not chapter.completed]
+    if failed:
+        print(f"{len(failed)} chapter(s) could not be completed; run again to resume them.")
+    return 1 if failed else 0
+
+# Guarded so the transcode worker processes can import this module without prompting
+if __name__ == "__main__":
+    sys.exit(main())
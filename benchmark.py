@@ -0,0 +1,372 @@
+"""Offline benchmark for the manga downloader.
+
+Runs a local stand-in for the manga site (series pages, chapter readers with
+two image servers, a MangaDex API stub) and drives the real download code
+against it, reporting throughput, page latency, CPU time and peak memory.
+
+    python benchmark.py --series 2 --chapters 10 --pages 20 --latency-ms 30
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs, quote
+
+from PIL import Image
+
+import PythonApplication1 as app
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Images are generated once per (format, size) and served for every page that uses them
+_image_cache = {}
+_image_lock = threading.Lock()
+
+CONTENT_TYPES = {"jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp", "gif": "image/gif"}
+
+def synthetic_image(image_format, width, height, seed):
+    key = (image_format, width, height, seed % 4)
+    with _image_lock:
+        if key not in _image_cache:
+            rng = random.Random(seed % 4)
+            # Noise bands compress about as badly as real scans do
+            band = bytes(rng.getrandbits(8) for _ in range(width * 3 * 16))
+            raw = (band * (height // 16 + 1))[:width * height * 3]
+            img = Image.frombytes("RGB", (width, height), raw)
+            if image_format == "gif":
+                img = img.convert("P")
+            buffer = BytesIO()
+            img.save(buffer, image_format.upper(), **({"quality": 85} if image_format == "jpeg" else {}))
+            _image_cache[key] = buffer.getvalue()
+        return _image_cache[key]
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # The downloader drops the losing side of a hedged request mid-response
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class StandInSite:
+    """Local HTTP site shaped like the real one: series pages, reader pages and two image servers."""
+
+    def __init__(self, series_count, chapters, pages, formats, sizes, latency, error_rate, stall_rate=0.0, stall=0.0):
+        self.chapters = {f"series-{s}": chapters for s in range(1, series_count + 1)}
+        self.pages = pages
+        self.formats = formats
+        self.sizes = sizes
+        self.latency = latency
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate  # fraction of first-mirror image requests held back before answering
+        self.stall = stall
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._servers = []
+        self.site_url = self._start(self._site_handler())
+        self.image_urls = [self._start(self._image_handler(server)) for server in range(2)]
+
+    def _start(self, handler):
+        server = QuietHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self._servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    def close(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+    def add_chapters(self, count):
+        for series in self.chapters:
+            self.chapters[series] += count
+
+    def series_urls(self):
+        return [f"{self.site_url}/manga/{series}" for series in self.chapters]
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    def _count(self, size):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += size
+
+    def series_page(self, series):
+        chapter_count = self.chapters[series]
+        rows = "".join(
+            f'<li class="a-h"><a rel="nofollow" class="chapter-name text-nowrap" '
+            f'href="{self.site_url}/manga/{series}/chapter-{c}">Chapter {c}</a>'
+            f'<span class="chapter-time text-nowrap">Jan 01,24</span></li>'
+            for c in range(chapter_count, 0, -1))  # Newest first, like the real site
+        return (
+            f'<html><body><div class="panel-story-info">'
+            f'<div class="story-info-left"><span class="info-image">'
+            f'<img class="img-loading" src="{self.image_urls[0]}/cover/{series}.jpeg"></span></div>'
+            f'<div class="story-info-right"><h1>Bench {series}</h1><table class="variations-tableInfo"><tbody>'
+            f'<tr><td class="table-label">Alternative :</td><td class="table-value"><h2>Alt {series} ; Other {series}</h2></td></tr>'
+            f'</tbody></table></div></div>'
+            f'<div class="panel-story-chapter-list"><ul class="row-content-chapter">{rows}</ul></div>'
+            f'</body></html>')
+
+    def chapter_page(self, series, chapter, server):
+        image_url = self.image_urls[server - 1]
+        images = "".join(
+            f'<img src="{image_url}/img/{series}/{chapter}/{p}.{self.formats[(chapter + p) % len(self.formats)]}">'
+            for p in range(1, self.pages + 1))
+        path = quote(f"/manga/{series}/chapter-{chapter}")
+        buttons = "".join(
+            f'<a class="server-image-btn" data-l="{self.site_url}/switch?server={n}&back={path}">Server {n}</a>'
+            for n in (1, 2))
+        return f'<html><body>{buttons}<div class="container-chapter-reader">{images}</div></body></html>'
+
+    def _site_handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", content_type="text/html; charset=utf-8", extra_headers=()):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in extra_headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+                site._count(len(body) if self.command != "HEAD" else 0)
+
+            def _send_html(self, body):
+                # Like the real site: an ETag for conditional requests and gzip when the client accepts it
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, extra_headers=[("ETag", etag)])
+                elif "gzip" in self.headers.get("Accept-Encoding", ""):
+                    self._send(200, gzip.compress(body), extra_headers=[("ETag", etag), ("Content-Encoding", "gzip")])
+                else:
+                    self._send(200, body, extra_headers=[("ETag", etag)])
+
+            def do_GET(self):
+                site._delay()
+                parsed = urlparse(self.path)
+                parts = parsed.path.strip("/").split("/")
+
+                if parsed.path == "/switch":
+                    query = parse_qs(parsed.query)
+                    # The real site remembers the image server in a cookie and redirects back
+                    self._send(302, extra_headers=[("Location", query["back"][0]),
+                                                   ("Set-Cookie", f"content_server=server{query['server'][0]}; Path=/")])
+                elif parsed.path == "/api/manga":
+                    self._send(200, json.dumps({"result": "ok", "data": []}).encode(), "application/json")
+                elif len(parts) == 2 and parts[0] == "manga" and parts[1] in site.chapters:
+                    self._send_html(site.series_page(parts[1]).encode())
+                elif len(parts) == 3 and parts[0] == "manga" and parts[2].startswith("chapter-"):
+                    server = 2 if "content_server=server2" in self.headers.get("Cookie", "") else 1
+                    self._send_html(site.chapter_page(parts[1], int(parts[2].split("-")[1]), server).encode())
+                else:
+                    self._send(404, b"not found")
+
+            do_HEAD = do_GET
+
+        return Handler
+
+    def _image_handler(self, server):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                site._delay()
+                if server == 0 and site.stall_rate and random.random() < site.stall_rate:
+                    time.sleep(site.stall)
+                parts = urlparse(self.path).path.strip("/").split("/")
+                if site.error_rate and random.random() < site.error_rate:
+                    body, status, content_type = b"busy", 503, "text/plain"
+                elif parts[0] in ("img", "cover"):
+                    name, image_format = parts[-1].rsplit(".", 1)
+                    seed = sum(map(ord, self.path))
+                    width, height = site.sizes[seed % len(site.sizes)]
+                    body, status, content_type = synthetic_image(image_format, width, height, seed), 200, CONTENT_TYPES[image_format]
+                else:
+                    body, status, content_type = b"not found", 404, "text/plain"
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+                site._count(len(body) if self.command != "HEAD" else 0)
+
+            do_HEAD = do_GET
+
+        return Handler
+
+def peak_rss_mb():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+def cpu_seconds():
+    # Includes the transcode worker processes once they have been reaped
+    if resource is not None:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    return time.process_time()
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+class PageTimer:
+    """Wraps an app fetch function to record per-page latency for the stage being measured."""
+
+    def __init__(self, target):
+        self.latencies = []
+        self._lock = threading.Lock()
+        self._target = target
+        self._original = getattr(app, target)
+
+    def __enter__(self):
+        def timed_fetch(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return self._original(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.latencies.append(time.perf_counter() - start)
+        setattr(app, self._target, timed_fetch)
+        return self
+
+    def __exit__(self, *exc_info):
+        setattr(app, self._target, self._original)
+
+def run_stage(name, func, chapters=0, timed="fetch_image_bytes"):
+    app.metrics.reset()
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    with PageTimer(timed) as timer:
+        func()
+    wall = time.perf_counter() - wall_start
+    latencies = timer.latencies
+    return {
+        "stage": name,
+        "wall_s": round(wall, 3),
+        "cpu_s": round(cpu_seconds() - cpu_start, 3),
+        "chapters_per_min": round(chapters / wall * 60, 1) if chapters else None,
+        "pages": len(latencies),
+        "pages_per_s": round(len(latencies) / wall, 1) if latencies else None,
+        "p50_page_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        "p99_page_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+        "metrics": app.metrics.summary(),
+    }
+
+def bench_image_convert(site, count):
+    urls = [f"{site.image_urls[0]}/img/convert/1/{i}.{site.formats[i % len(site.formats)]}" for i in range(count)]
+    for idx, img_url in enumerate(urls, start=1):
+        app.discard_body(app.download_image_convert(img_url, f"{idx:03}.jpg"))
+
+def bench_create_cbz(manga_dir, chapters, pages):
+    page_data = [(f"{p:03}.jpg", synthetic_image("jpeg", 800, 1200, p)) for p in range(1, pages + 1)]
+    for chapter in range(1, chapters + 1):
+        app.create_cbz_file("Packaging", f"Chapter {chapter}", manga_dir, page_data)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the downloader against a local stand-in site.")
+    parser.add_argument("--series", type=int, default=2, help="series on the stand-in site")
+    parser.add_argument("--chapters", type=int, default=5, help="chapters per series for the initial download")
+    parser.add_argument("--new-chapters", type=int, default=2, help="chapters added before the update stage")
+    parser.add_argument("--pages", type=int, default=12, help="pages per chapter")
+    parser.add_argument("--formats", default="jpeg,png,webp,gif", help="comma-separated page formats to rotate through")
+    parser.add_argument("--sizes", default="800x1200,1080x1600,720x4000", help="comma-separated WxH page sizes")
+    parser.add_argument("--latency-ms", type=float, default=20, help="mean added latency per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of image requests answered with 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="fraction of first-mirror image requests that stall")
+    parser.add_argument("--stall-ms", type=float, default=3000, help="how long a stalled image request is held")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary library for inspection")
+    args = parser.parse_args(argv)
+
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    sizes = [tuple(int(n) for n in size.split("x")) for size in args.sizes.split(",")]
+    site = StandInSite(args.series, args.chapters, args.pages, formats, sizes, args.latency_ms / 1000, args.error_rate,
+                       args.stall_rate, args.stall_ms / 1000)
+    library_dir = tempfile.mkdtemp(prefix="manga-bench-")
+    cache_dir = tempfile.mkdtemp(prefix="manga-bench-cache-")
+
+    # Point the downloader at the sandbox instead of the real library, caches and sites
+    app.base_dir = library_dir
+    app.cache_dir = cache_dir
+    app.mangadex_api_url = f"{site.site_url}/api"
+
+    results = []
+    try:
+        results.append(run_stage("download_image_convert", lambda: bench_image_convert(site, args.pages * 2)))
+        packaging_dir = os.path.join(library_dir, "Packaging")
+        os.makedirs(packaging_dir, exist_ok=True)
+        results.append(run_stage("create_cbz_file", lambda: bench_create_cbz(packaging_dir, args.chapters, args.pages)))
+
+        series_urls = site.series_urls()
+        # A dry run always sizes pages, like --dry-run; download and update below run the preflight as usual
+        results.append(run_stage("preflight", lambda: app.preflight_check([app.SeriesJob(url) for url in series_urls],
+                                                                           dry_run=True)))
+        results.append(run_stage("download_manga", lambda: [app.download_manga(url) for url in series_urls],
+                                 chapters=args.series * args.chapters, timed="fetch_hedged"))
+
+        site.add_chapters(args.new_chapters)
+        # The update command's path: update check, preflight, then the pipeline
+        results.append(run_stage("update_folders", lambda: app.update_folders(app.series_folders(), interactive=False),
+                                 chapters=args.series * args.new_chapters, timed="fetch_hedged"))
+    finally:
+        site.close()
+        if not args.keep:
+            shutil.rmtree(library_dir, ignore_errors=True)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print()
+    columns = ["stage", "wall_s", "cpu_s", "chapters_per_min", "pages", "pages_per_s", "p50_page_ms", "p99_page_ms", "peak_rss_mb"]
+    print("  ".join(f"{column:>16}" for column in columns))
+    for result in results:
+        print("  ".join(f"{'-' if result[column] is None else result[column]!s:>16}" for column in columns))
+    print(f"\nStand-in site served {site.requests} requests, {site.bytes_sent / (1024 * 1024):.1f} MB")
+    if args.keep:
+        print(f"Library kept at {library_dir}, caches at {cache_dir}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump({"args": vars(args), "results": results, "requests": site.requests,
+                       "bytes_sent": site.bytes_sent}, json_file, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main()